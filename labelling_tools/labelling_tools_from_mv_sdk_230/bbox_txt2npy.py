@@ -8,93 +8,64 @@ Tool to convert BBOX text format (BB_CREATE, ...) into EventBbox numpy arrays
 """
 
 import argparse
+import glob
 import os
 import sys
+from multiprocessing import Pool
 import numpy as np
 
 
 from metavision_sdk_core import EventBbox
 
+import label
+
 
 def bboxstr2array(lines):
     """Converts the lines of a bbox text file into an EventBbox numpy array
 
+    The lines are parsed as a stream by label.parse_bbox_lines, the parser of label_tracking.py, into the columns of
+    label.BBOX_DTYPE, one row per command but BB_DELETE in file order, then cast to EventBbox. Invalid lines raise an
+    AssertionError.
+
     Args:
-        lines: list of lines (content of the _bbox.txt file)
+        lines: iterable of lines (content of the _bbox.txt file or the open file itself)
     """
-    assert isinstance(lines, list)
-    dic_current_boxes = {}
-    list_boxes = []
-    for line in lines:
-        line = line.strip()
-        if line == "":
-            continue
-        line_list = line.split()
-        assert len(line_list) >= 2, f"Invalid file:\n{line}"
-        ts = int(line_list[0])
-        object_id = int(line_list[1])
-        command = line_list[2]
-        assert command in ["BB_CREATE", "BB_MOVE", "BB_RESIZE",
-                           "BB_MOVE_AND_RESIZE", "BB_DELETE"], f"Invalid file:\n{line}"
-        if command == "BB_CREATE":
-            assert len(line_list) == 9, f"Invalid line for BB_CREATE:\n{line}"
-            class_id = int(line_list[3])
-            x, y, width, height, confidence = [float(i) for i in line_list[4:]]
-            box = np.zeros(1, dtype=EventBbox)
-            box["t"] = ts
-            box["x"] = x
-            box["y"] = y
-            box["w"] = width
-            box["h"] = height
-            box["class_id"] = class_id
-            box["track_id"] = object_id
-            box["class_confidence"] = confidence
-            list_boxes.append(box.copy())
-            assert object_id not in dic_current_boxes
-            dic_current_boxes[object_id] = box.copy()
-        elif command == "BB_MOVE":
-            assert object_id in dic_current_boxes
-            x, y, confidence = [float(i) for i in line_list[3:]]
-            dic_current_boxes[object_id]["x"] = x
-            dic_current_boxes[object_id]["y"] = y
-            dic_current_boxes[object_id]["class_confidence"] = confidence
-            list_boxes.append(dic_current_boxes[object_id].copy())
-        elif command == "BB_RESIZE":
-            assert object_id in dic_current_boxes
-            width, height, confidence = [float(i) for i in line_list[3:]]
-            dic_current_boxes[object_id]["t"] = ts
-            dic_current_boxes[object_id]["w"] = width
-            dic_current_boxes[object_id]["h"] = height
-            dic_current_boxes[object_id]["class_confidence"] = confidence
-            list_boxes.append(dic_current_boxes[object_id].copy())
-        elif command == "BB_MOVE_AND_RESIZE":
-            assert object_id in dic_current_boxes
-            x, y, width, height, confidence = [float(i) for i in line_list[3:]]
-            dic_current_boxes[object_id]["t"] = ts
-            dic_current_boxes[object_id]["x"] = x
-            dic_current_boxes[object_id]["y"] = y
-            dic_current_boxes[object_id]["w"] = width
-            dic_current_boxes[object_id]["h"] = height
-            dic_current_boxes[object_id]["class_confidence"] = confidence
-            list_boxes.append(dic_current_boxes[object_id].copy())
-        elif command == "BB_DELETE":
-            assert object_id in dic_current_boxes
-            del dic_current_boxes[object_id]
-        else:
-            raise RuntimeError(f"Wrong key in bbox file: {command}")
-    if len(dic_current_boxes) != 0:
-        print(f"Warning: Some boxes were created but not deleted !  Remaining keys: {dic_current_boxes.keys()}")
-    boxes_array = np.concatenate(list_boxes)
-    return boxes_array
+    rows = ((ts, *bbox, class_id, bbox_id, probability)
+            for ts, bbox_id, class_id, bbox, probability in label.parse_bbox_lines(lines, strict=True)
+            if class_id is not None)
+    rows = np.fromiter(rows, dtype=label.BBOX_DTYPE.descr[:-1])
+    boxes = np.zeros(len(rows), dtype=EventBbox)
+    for name in boxes.dtype.names:
+        boxes[name] = rows[name]
+    return boxes
+
+
+def convert_file(filenames):
+    """Converts a bbox text file into a npy file"""
+    input_filename, output_filename = filenames
+    with open(input_filename, "r") as file:
+        bboxes_array = bboxstr2array(file)
+    np.save(output_filename, bboxes_array)
+    return output_filename
 
 
 def parse_args(argv):
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description="Convert bbox text format to npy")
-    parser.add_argument("-i", dest="input_filename", required=True, help="Input bbox TXT filename")
-    parser.add_argument("-o", dest="output_filename", required=True, help="Output npy filename")
+    parser.add_argument("-i", dest="input_filename", required=True,
+                        help="Input bbox TXT filename, or directory of bbox TXT files")
+    parser.add_argument("-o", dest="output_filename", default="",
+                        help="Output npy filename, or output directory of the [input_filename]_bbox.npy files. "
+                        "By default, [input_filename]_bbox.npy next to the input")
+    parser.add_argument("-j", dest="num_workers", type=int, default=os.cpu_count(),
+                        help="Number of processes converting a directory")
     args = parser.parse_args(argv)
+    if os.path.isdir(args.input_filename):
+        args.output_filename = args.output_filename or args.input_filename
+        assert not os.path.isfile(args.output_filename), "Output should be a directory"
+        return args
     assert os.path.isfile(args.input_filename)
+    args.output_filename = args.output_filename or os.path.splitext(args.input_filename)[0] + "_bbox.npy"
     assert not os.path.exists(args.output_filename), "Output filename already exists"
     assert args.output_filename.lower().endswith(".npy"), "Output filename should by a numpy array (.npy)"
     return args
@@ -102,9 +73,21 @@ def parse_args(argv):
 
 def process_args(args):
     """Process command line arguments"""
-    lines = open(args.input_filename, "r").readlines()
-    bboxes_array = bboxstr2array(lines)
-    np.save(args.output_filename, bboxes_array)
+    if not os.path.isdir(args.input_filename):
+        convert_file((args.input_filename, args.output_filename))
+        return
+    os.makedirs(args.output_filename, exist_ok=True)
+    filenames = []
+    for input_filename in sorted(glob.glob(os.path.join(args.input_filename, "*.txt"))):
+        name = os.path.splitext(os.path.basename(input_filename))[0]
+        output_filename = os.path.join(args.output_filename, name + "_bbox.npy")
+        if os.path.exists(output_filename):
+            print(f"Skipping {input_filename}, {output_filename} already exists")
+        else:
+            filenames.append((input_filename, output_filename))
+    with Pool(max(min(args.num_workers, len(filenames)), 1)) as pool:
+        for output_filename in pool.imap_unordered(convert_file, filenames):
+            print(f"Saved {output_filename}")
 
 
 def main():
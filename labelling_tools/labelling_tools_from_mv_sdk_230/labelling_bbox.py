@@ -57,6 +57,7 @@ class LabellingBBox:
         self.init_move_y = 0
         self.class_id = 0
         self.manually_created = True
+        self.prelabelled = False  # read from a prelabel.py file and not edited yet, never tracked
         self.tracker = None
         self.end_of_track = -1
         self.hidden = False
@@ -75,6 +76,7 @@ class LabellingBBox:
         self.init_move_y = dest_bbox.init_move_y
         self.class_id = dest_bbox.class_id
         self.manually_created = dest_bbox.manually_created
+        self.prelabelled = dest_bbox.prelabelled
         self.tracker = dest_bbox.tracker
         self.end_of_track = dest_bbox.end_of_track
         self.hidden = dest_bbox.hidden
@@ -147,6 +149,7 @@ class LabellingBBox:
             self.manually_created = True
         else:
             self.manually_created = bbox_info["manually_created"]
+        self.prelabelled = bbox_info.get("prelabelled", False)
 
         if "end_of_track" not in bbox_info:
             self.end_of_track = -1
@@ -161,6 +164,7 @@ class LabellingBBox:
                                self.width,
                                self.height]),
                 "manually_created": self.manually_created,
+                "prelabelled": self.prelabelled,
                 "end_of_track": self.end_of_track}
 
     def is_null(self, min_size):
@@ -223,7 +227,7 @@ class FrameLabellingBBoxes:
     def create_tracker_for_new_bboxes(self):
         """Create tracker for new bounding boxes"""
         for bbox in self.bbox_list:
-            if not bbox.tracker:
+            if not bbox.tracker and not bbox.prelabelled:
                 try:
                     tracker = cv2.Tracker_create(self.tracker_name)
                     if tracker.init(self.prev_input_frame, bbox.to_tracker_bbox()):
@@ -685,6 +689,7 @@ class FrameLabellingBBoxes:
         if not self.bbox_selected.is_null(self.min_bbox_size):
             self.bbox_selected.status = LabellingBBoxState.SET
             self.bbox_selected.manually_created = True
+            self.bbox_selected.prelabelled = False  # edited or drawn by hand, tracked from the next frame
             correct_bbox(self.bbox_selected, self.input_frame.shape[1], self.input_frame.shape[0])
             if self.bbox_selected.tracker:
                 del self.bbox_selected.tracker
@@ -7,10 +7,20 @@
 # on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and limitations under the License.
 
+import heapq
 import os
 import numpy
 import warnings
 
+# bboxes of a label file as columns, one row per object and frame, named as the EventBbox fields where they overlap
+BBOX_DTYPE = numpy.dtype([("t", numpy.int64), ("x", numpy.float64), ("y", numpy.float64), ("w", numpy.float64),
+                          ("h", numpy.float64), ("class_id", numpy.int64), ("track_id", numpy.int64),
+                          ("class_confidence", numpy.float64), ("end_of_track", numpy.int64)])
+# number of tokens of each command of a label file, probability included
+COMMAND_TOKENS = {"BB_CREATE": 9, "BB_MOVE": 6, "BB_RESIZE": 6, "BB_MOVE_AND_RESIZE": 8, "BB_DELETE": 3}
+# first line of the label files written by prelabel.py, a comment for the parsers
+PRELABEL_HEADER = "% pre-labelled by prelabel.py\n"
+
 
 def write_bboxes(filename, bboxes, redundant=True, full_protocol=False,
                  tracked=True, delta_t=100000, default_class_id=0, header=""):
@@ -39,29 +49,23 @@ def write_bboxes(filename, bboxes, redundant=True, full_protocol=False,
     dirname = os.path.dirname(os.path.abspath(filename))
     if not os.path.isdir(dirname):
         os.makedirs(dirname)
-    file = open(filename, "w")
-    if header:
-        file.write(header)
+    lines = [header] if header else []  # commands are buffered and written at once
 
     last_bbox = {}
-    bbox_buffer = {}  # dictionary mapping timestamps to corresponding bb_delete in untracked format
+    bbox_buffer = []  # heap of (timestamp, order, object id) of the BB_DELETE to come in untracked format
     for i in sorted(bboxes):
 
         if not bboxes[i]:
             if last_bbox:
                 for id_obj in last_bbox:
-                    command = str(i).zfill(10) + " " + str(id_obj) + " BB_DELETE\n"
-                    file.write(command)
+                    lines.append(str(i).zfill(10) + " " + str(id_obj) + " BB_DELETE\n")
             last_bbox.clear()
         else:
             if not tracked:
                 # we clear the BB_DELETE that come before timestamp (=i)
-                bbox_to_delete = list(filter(lambda k: k < i, sorted(bbox_buffer.keys())))
-                for ts in bbox_to_delete:
-                    for id_ in bbox_buffer[ts]:
-                        file.write("{:010d} {:d} BB_DELETE\n".format(ts, id_))
-                    bbox_buffer.pop(ts)
-            bbox_buffer[int(i + delta_t)] = {}
+                while bbox_buffer and bbox_buffer[0][0] < i:
+                    ts, _, id_ = heapq.heappop(bbox_buffer)
+                    lines.append("{:010d} {:d} BB_DELETE\n".format(ts, id_))
             for id_obj in bboxes[i]:
                 command = str(i).zfill(10) + " " + str(id_obj) + " BB_"
 
@@ -81,17 +85,17 @@ def write_bboxes(filename, bboxes, redundant=True, full_protocol=False,
                     class_id = bboxes[i][id_obj]['class_id']
 
                 if id_obj in last_bbox:
-                    bbox_diff = numpy.subtract(new_bbox, last_bbox[id_obj])
-                    if (bbox_diff[0] != 0 or bbox_diff[1] != 0) and \
-                            (bbox_diff[2] != 0 or bbox_diff[3] != 0):
+                    moved = new_bbox[:2] != last_bbox[id_obj][:2]
+                    resized = new_bbox[2:] != last_bbox[id_obj][2:]
+                    if moved and resized:
                         command += "MOVE_AND_RESIZE {:f} {:f} {:f} {:f} {:f}\n".format(*(new_bbox + (probability, )))
-                    elif (bbox_diff[0] != 0 or bbox_diff[1] != 0):
+                    elif moved:
                         if full_protocol:
                             command += "MOVE {:f} {:f} {:f}\n".format(*(new_bbox[0:2] + (probability, )))
                         else:
                             command += "MOVE_AND_RESIZE {:f} {:f} {:f} {:f} {:f}\n".format(
                                 *(new_bbox + (probability, )))
-                    elif (bbox_diff[2] != 0 or bbox_diff[3] != 0):
+                    elif resized:
                         if full_protocol:
                             command += "RESIZE {:f} {:f} {:f}\n".format(*(new_bbox[2:4] + (probability, )))
                         else:
@@ -111,116 +115,210 @@ def write_bboxes(filename, bboxes, redundant=True, full_protocol=False,
                     # if not tracked bboxes are saved at timestamp + delta_t
                     # to emit the BB_DELETE
                     else:
-                        bbox_buffer[int(i + delta_t)][id_obj] = bboxes[i]
+                        heapq.heappush(bbox_buffer, (int(i + delta_t), len(lines), id_obj))
 
-                file.write(command)
+                lines.append(command)
             to_delete = []
             for last_id in sorted(last_bbox.keys()):
                 if last_id not in bboxes[i]:
-                    command = str(i).zfill(10) + " " + str(last_id) + " BB_DELETE\n"
-                    file.write(command)
+                    lines.append(str(i).zfill(10) + " " + str(last_id) + " BB_DELETE\n")
                     to_delete.append(last_id)
 
             for id_to_delete in to_delete:
                 del last_bbox[id_to_delete]
     if not tracked:
         # at the end of the loop we send the last bbdelete
-        for ts in bbox_buffer:
-            for id_ in bbox_buffer[ts]:
-                file.write("{:010d} {:d} BB_DELETE\n".format(ts, id_))
-    file.close()
+        while bbox_buffer:
+            ts, _, id_ = heapq.heappop(bbox_buffer)
+            lines.append("{:010d} {:d} BB_DELETE\n".format(ts, id_))
+    with open(filename, "w") as file:
+        file.write("".join(lines))
 
 
-def read_bboxes(filename, keep_command_labels=[], timestep_us=5000):
-    """ This reads a txt file with labeled bboxes and produces
-    a dictionary with the information about the bounding boxes:
+def parse_bboxes(filename, keep_command_labels=[], strict=False):
+    """ This reads a txt file with labeled bboxes line by line and yields, for
+    each line, the current bbox of its object, see parse_bbox_lines.
+    """
+    with open(filename, "r") as file:
+        yield from parse_bbox_lines(file, keep_command_labels, strict)
 
-    an example of bboxes might be:
 
-    {1000: {1: {"class_id": 0, "bbox": (20,20,10,10), "probability":0.6}},
-     2000: {1: {"class_id": 0, "bbox": (20,20,10,10)},
-            2: {"class_id": 0, "bbox": (40,20,10,10)}},
-     3000: {2: {"class_id": 0, "bbox": (50,20,10,10)}},
-     .
-     .
-     .
-     }
-     You can optionally specify a list of command labels you would like to keep,
-     the dict returned will skip any command labels not in this list.
+def parse_bbox_lines(lines, keep_command_labels=[], strict=False):
+    """ This parses the lines of a txt file with labeled bboxes, i.e. the open
+    file, and yields, for each line, the current bbox of its object:
+
+    timestamp, bbox_id, class_id, (x, y, width, height), probability
+
+    class_id is None for a BB_DELETE of a created bbox, other commands are
+    skipped. You can optionally specify a list of command labels you would
+    like to keep, any command labels not in this list are skipped.
+
+    If strict is set, an AssertionError is raised for a line with an unknown
+    command or number of tokens, or with a command not valid for its object:
+    BB_CREATE of an object that exists or any other command of an object that
+    was not created or was deleted. Objects never deleted are warned about.
     """
-    file = open(filename, "r")
-    class_id = 0
-    bboxes = {}
-    created_bboxes = {}
-    for line in file:
+    created_bboxes = {}  # object id -> (class_id, (x, y, width, height)) of the current box
+    alive = set()  # object ids created and not deleted, if strict
+    for line in lines:
         if line[0] == "%":
             continue
-        probability = 1
-        end_of_track = -1
-        tokens = line.split(" ")
-        tokens[2] = tokens[2].rstrip()
-
+        tokens = line.split()
+        if not tokens:
+            continue
         if keep_command_labels and (not tokens[2] in keep_command_labels):
             continue
-
-        if tokens[2] == "BB_CREATE":
-            created_bboxes[int(tokens[1])] = (float(tokens[4]), float(tokens[5]),
-                                              float(tokens[6]), float(tokens[7]))
+        if strict and not (len(tokens) > 2 and len(tokens) == COMMAND_TOKENS.get(tokens[2])):
+            raise AssertionError("Invalid file:\n{}".format(line.rstrip()))
+        ts, bbox_id, command = int(tokens[0]), int(tokens[1]), tokens[2]
+        if strict:
+            if bbox_id < 0 or (bbox_id in alive) == (command == "BB_CREATE"):
+                raise AssertionError("Invalid file: {} {} {} for this object id".format(ts, bbox_id, command))
+            if command == "BB_CREATE":
+                alive.add(bbox_id)
+            elif command == "BB_DELETE":
+                alive.discard(bbox_id)
+        probability = 1.
+        if command == "BB_MOVE_AND_RESIZE":
+            class_id = created_bboxes[bbox_id][0]
+            bbox = (float(tokens[3]), float(tokens[4]), float(tokens[5]), float(tokens[6]))
+            if len(tokens) == 8:
+                probability = float(tokens[7])
+        elif command == "BB_CREATE":
+            class_id = int(tokens[3])
+            bbox = (float(tokens[4]), float(tokens[5]), float(tokens[6]), float(tokens[7]))
             if len(tokens) == 9:
-                probability = tokens[8]
-            class_id = tokens[3]
-        elif tokens[2] == "BB_MOVE":
+                probability = float(tokens[8])
+        elif command == "BB_MOVE":
             warnings.warn("In this protocol we assume that all trackers are created (BB_CREATE) in this file")
-            prev_box = created_bboxes[int(tokens[1])]
-            created_bboxes[int(tokens[1])] = (float(tokens[3]), float(tokens[4]),
-                                              prev_box[2], prev_box[3])
+            class_id, prev_box = created_bboxes[bbox_id]
+            bbox = (float(tokens[3]), float(tokens[4]), prev_box[2], prev_box[3])
             if len(tokens) == 6:
-                probability = tokens[5]
-        elif tokens[2] == "BB_RESIZE":
+                probability = float(tokens[5])
+        elif command == "BB_RESIZE":
             warnings.warn("In this protocol we assume that all trackers are created (BB_CREATE) in this file")
-            prev_box = created_bboxes[int(tokens[1])]
-            created_bboxes[int(tokens[1])] = (prev_box[0], prev_box[1],
-                                              float(tokens[3]), float(tokens[4]))
+            class_id, prev_box = created_bboxes[bbox_id]
+            bbox = (prev_box[0], prev_box[1], float(tokens[3]), float(tokens[4]))
             if len(tokens) == 6:
-                probability = tokens[5]
-        elif tokens[2] == "BB_MOVE_AND_RESIZE":
-            created_bboxes[int(tokens[1])] = (float(tokens[3]), float(tokens[4]),
-                                              float(tokens[5]), float(tokens[6]))
-            if len(tokens) == 8:
-                probability = tokens[7]
-        elif tokens[2] == "BB_DELETE":
-            end_of_track = int(tokens[0])
+                probability = float(tokens[5])
         else:
-            del created_bboxes[int(tokens[1])]
-
-        bbox_id = int(tokens[1])
-        frame_idx = int(tokens[0])
-        if bbox_id in created_bboxes:
-            # end_of_track to be updated for the given object
-            if end_of_track >= 0:
-                to_update_frame_idx = frame_idx - timestep_us
-                while to_update_frame_idx in bboxes:
-                    if bbox_id in bboxes[to_update_frame_idx]:
-                        bboxes[to_update_frame_idx][bbox_id]["end_of_track"] = frame_idx
-                        to_update_frame_idx -= timestep_us
-                    else:
-                        break
-                continue
-
-            if frame_idx not in bboxes:
-                bboxes[frame_idx] = {bbox_id: {"class_id": class_id,
-                                               "bbox": created_bboxes[bbox_id],
-                                               "probability": probability,
-                                               "end_of_track": end_of_track}}
-            else:
-                bboxes[frame_idx][bbox_id] = {"class_id": class_id,
-                                              "bbox": created_bboxes[bbox_id],
-                                              "probability": probability,
-                                              "end_of_track": end_of_track}
+            if command == "BB_DELETE" and bbox_id in created_bboxes:
+                yield ts, bbox_id, None, created_bboxes[bbox_id][1], probability
+            continue
+        created_bboxes[bbox_id] = class_id, bbox
+        yield ts, bbox_id, class_id, bbox, probability
+    if alive:
+        warnings.warn("Some boxes were created but not deleted !  Remaining keys: {}".format(sorted(alive)))
+
+
+def read_bboxes_array(filename, keep_command_labels=[], timestep_us=5000):
+    """ This reads a txt file with labeled bboxes in a single pass and returns
+    a BBOX_DTYPE structured array sorted by timestamp, with one row per object
+    and frame:
+
+    t, x, y, w, h, class_id, track_id, class_confidence, end_of_track
 
+    end_of_track is the timestamp of the BB_DELETE ending the run of frames
+    spaced by timestep_us that the row belongs to, -1 if there is none. It is
+    filled after reading from the start and end index of each run.
+    You can optionally specify a list of command labels you would like to keep,
+    any command labels not in this list are skipped.
+    """
+    rows = numpy.fromiter(((ts, *bbox, -1 if class_id is None else class_id, bbox_id, probability)  # -1 BB_DELETE
+                           for ts, bbox_id, class_id, bbox, probability in parse_bboxes(filename, keep_command_labels)),
+                          dtype=BBOX_DTYPE.descr[:-1])
+    bboxes = numpy.full(len(rows), -1, dtype=BBOX_DTYPE)
+    if not len(rows):
+        return bboxes
+    for name in rows.dtype.names:
+        bboxes[name] = rows[name]
+
+    # lines of each object sorted by timestamp then file order, the last box of each object and frame is kept
+    order = numpy.lexsort((numpy.arange(len(bboxes)), bboxes["t"], bboxes["track_id"]))
+    ids, ts, deleted = bboxes["track_id"][order], bboxes["t"][order], bboxes["class_id"][order] < 0
+    sel = numpy.flatnonzero(~deleted)
+    sel = sel[numpy.r_[(ids[sel][1:] != ids[sel][:-1]) | (ts[sel][1:] != ts[sel][:-1]), True]]
+    if not len(sel):
+        return bboxes[:0]
+
+    # runs of frames spaced by timestep_us of each object
+    run = numpy.cumsum(numpy.r_[True, (ids[sel][1:] != ids[sel][:-1]) |
+                                (ts[sel][1:] != ts[sel][:-1] + timestep_us)]) - 1
+
+    # a BB_DELETE ends the run holding the box of the frame before it if that box was read before it, the last
+    # BB_DELETE of the file ending a run sets end_of_track from the start of the run up to that box
+    dels = numpy.sort(order[deleted])  # in file order
+    track_ids = numpy.unique(ids)
+    span = int(ts.max() - ts.min()) + 2 * timestep_us  # object and timestamp as a single sorted key
+    keys = numpy.searchsorted(track_ids, ids[sel]) * span + ts[sel] - ts.min() + timestep_us
+    del_keys = numpy.searchsorted(track_ids, bboxes["track_id"][dels]) * span + bboxes["t"][dels] - ts.min()
+    j = numpy.minimum(numpy.searchsorted(keys, del_keys), len(sel) - 1)
+    valid = (keys[j] == del_keys) & (order[sel][j] < dels)
+    end = numpy.full(run[-1] + 1, -1)  # index of the last box of each run ended by a BB_DELETE
+    end_t = numpy.full(run[-1] + 1, -1)
+    end[run[j[valid]]], end_t[run[j[valid]]] = j[valid], bboxes["t"][dels[valid]]
+
+    bboxes = bboxes[order[sel]]
+    bboxes["end_of_track"] = numpy.where(numpy.arange(len(sel)) <= end[run], end_t[run], -1)
+    return bboxes[numpy.lexsort((order[sel], bboxes["t"]))]
+
+
+def read_bboxes(filename, keep_command_labels=[], timestep_us=5000, as_array=False):
+    """ This reads a txt file with labeled bboxes and produces
+    a dictionary with the information about the bounding boxes:
+
+    {
+     frame_idx_1: {
+        bbox_id_1: {
+          "class_id": ..,
+          "bbox": (x, y, width, height),
+          "probability": ..,
+          "end_of_track": ..
+        },
+        ...
+       },
+     ...
+     }
+     You can optionally specify a list of command labels you would like to keep,
+     the dict returned will skip any command labels not in this list.
+
+     The file is read in a single pass. The bboxes of each object are gathered
+     in runs of frames spaced by timestep_us, a BB_DELETE records the end of
+     the run holding the frame before it and end_of_track is filled once per
+     run after reading. If as_array is set, the BBOX_DTYPE structured array of
+     read_bboxes_array is returned instead of the dictionary.
+    """
+    if as_array:
+        return read_bboxes_array(filename, keep_command_labels, timestep_us)
+    bboxes = {}
+    runs = {}  # object id -> (timestamp, bboxes) of the last frame and run of frames of the object
+    ends = {}  # id of a run -> (run, number of bboxes of the run ended, end_of_track) of its last BB_DELETE
+    for ts, bbox_id, class_id, bbox, probability in parse_bboxes(filename, keep_command_labels):
+        last_ts, run = runs.get(bbox_id, (None, None))
+        if class_id is None:  # ends the run up to the bbox of the frame before
+            num_bboxes = len(run) - (last_ts == ts) if last_ts in (ts, ts - timestep_us) else 0
+            if num_bboxes:
+                ends[id(run)] = run, num_bboxes, ts
+            continue
+        frame = bboxes.get(ts)
+        if frame is None:
+            frame = bboxes[ts] = {}
+        frame[bbox_id] = bbox_dict = {"class_id": class_id,
+                                      "bbox": bbox,
+                                      "probability": probability,
+                                      "end_of_track": -1}
+        if last_ts == ts:
+            run[-1] = bbox_dict
+        elif last_ts == ts - timestep_us:
+            run.append(bbox_dict)
         else:
-            bboxes[frame_idx] = {}
+            runs[bbox_id] = ts, [bbox_dict]
+            continue
+        runs[bbox_id] = ts, run
 
+    for run, num_bboxes, end_of_track in ends.values():
+        for bbox_dict in run[:num_bboxes]:
+            bbox_dict["end_of_track"] = end_of_track
     return bboxes
 
 
@@ -236,3 +334,84 @@ def get_number_of_bboxes(filename):
         if tokens[2] == "BB_CREATE":
             bboxes.add(tokens[1])
     return len(bboxes)
+
+
+def is_prelabel_file(filename):
+    """Returns True if the label file was written by prelabel.py, i.e. starts with PRELABEL_HEADER"""
+    with open(filename, "r") as file:
+        return file.readline() == PRELABEL_HEADER
+
+
+class BboxJournal:
+    """ Append-only journal of a bboxes dictionary (see write_bboxes) being
+    edited, so that an interrupted labelling session can be recovered.
+
+    Each flush appends one line per frame marked as edited (see mark) and
+    changed since the previous flush:
+
+    timestamp number_of_bboxes [bbox_id class_id x y width height end_of_track] ...
+
+    and the file is synced to disk. Replaying the journal, the last line of a
+    frame replaces the frame.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.frames = {}  # timestamp -> last line journaled for the frame
+        self.dirty = None  # timestamps of the frames edited since the previous flush, None for every frame
+        self.file = open(filename, "a")
+
+    @staticmethod
+    def frame_line(ts, frame):
+        """Returns the journal line of the bboxes of a frame"""
+        line = "{:010d} {:d}".format(ts, len(frame))
+        for bbox_id, bbox_info in frame.items():
+            line += " {} {} {:f} {:f} {:f} {:f} {}".format(bbox_id, bbox_info.get("class_id", 0), *bbox_info["bbox"],
+                                                           bbox_info.get("end_of_track", -1))
+        return line + "\n"
+
+    def mark(self, *timestamps):
+        """Marks frames as edited, every frame if no timestamp is given"""
+        if not timestamps:
+            self.dirty = None
+        elif self.dirty is not None:
+            self.dirty.update(timestamps)
+
+    def flush(self, bboxes):
+        """Appends the marked frames of bboxes changed since the previous flush and returns their number"""
+        lines = []
+        for ts in bboxes if self.dirty is None else sorted(self.dirty & bboxes.keys()):
+            line = self.frame_line(ts, bboxes[ts])
+            if self.frames.get(ts) != line:
+                self.frames[ts] = line
+                lines.append(line)
+        self.dirty = set()
+        if lines:
+            self.file.write("".join(lines))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        return len(lines)
+
+    def close(self, remove=False):
+        """Closes the journal and optionally removes its file, i.e. once the bboxes are written"""
+        self.file.close()
+        if remove:
+            os.remove(self.filename)
+
+    @staticmethod
+    def replay(filename, bboxes=None):
+        """Replays a journal on top of bboxes, a new dictionary by default, and returns it.
+        A last line cut by an interruption is skipped."""
+        if bboxes is None:
+            bboxes = {}
+        with open(filename, "r") as file:
+            for line in file:
+                tokens = line.split()
+                if len(tokens) < 2 or len(tokens) != 2 + 7 * int(tokens[1]) or not line.endswith("\n"):
+                    continue
+                frame = bboxes[int(tokens[0])] = {}
+                for k in range(2, len(tokens), 7):
+                    frame[int(tokens[k])] = {"class_id": int(tokens[k + 1]),
+                                             "bbox": tuple(map(float, tokens[k + 2:k + 6])),
+                                             "end_of_track": int(tokens[k + 6])}
+        return bboxes
@@ -14,6 +14,9 @@ import glob
 from labelling_bbox import *
 import label
 import argparse
+import collections
+import threading
+import time
 from bbox_txt2npy import bboxstr2array
 
 # versioning info
@@ -29,11 +32,91 @@ def read_image(frame_index):
     return frame is not None, frame
 
 
+class VideoFrameProvider:
+    """Frames of a video decoded by a background thread and kept in a LRU cache
+
+    The thread decodes sequentially the read_ahead frames following the last frame requested, then the look_behind
+    frames preceding it, so that autoplay and stepping back or forth are served from the cache. The video is only
+    seeked when the next frame to decode is not the next frame of the video, i.e. after a jump.
+
+    Args:
+        video: opened cv2.VideoCapture, only read by the thread
+        cache_size: maximum number of decoded frames kept
+        read_ahead: number of frames decoded after the requested frame
+        look_behind: number of frames decoded before the requested frame
+    """
+
+    def __init__(self, video, cache_size=128, read_ahead=32, look_behind=32):
+        assert cache_size > read_ahead + look_behind, "The cache must hold the read ahead and look behind frames"
+        self.video = video
+        self.cache_size = cache_size
+        self.read_ahead = read_ahead
+        self.look_behind = look_behind
+        self.cache = collections.OrderedDict()  # frame index -> frame, least recently used first
+        self.condition = threading.Condition()
+        self.cursor = 0  # last frame requested
+        self.position = 0  # next frame of the video
+        self.number_of_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT)) or float("inf")  # lowered at a failed read
+        self.stopped = False
+        self.thread = threading.Thread(target=self.decode, daemon=True)
+        self.thread.start()
+
+    def next_frame_to_decode(self):
+        """Returns the first frame missing from the cache ahead of the cursor then behind it, None if there is none"""
+        ahead = range(self.cursor, min(self.cursor + self.read_ahead + 1, self.number_of_frames))
+        behind = range(max(self.cursor - self.look_behind, 0), self.cursor)
+        for frame_index in (*ahead, *behind):
+            if frame_index not in self.cache:
+                return frame_index
+        return None
+
+    def decode(self):
+        """Decodes the frames around the cursor until stopped"""
+        while True:
+            with self.condition:
+                frame_index = self.next_frame_to_decode()
+                while frame_index is None and not self.stopped:
+                    self.condition.wait()
+                    frame_index = self.next_frame_to_decode()
+                if self.stopped:
+                    return
+            if frame_index != self.position:
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            ok, frame = self.video.read()
+            self.position = frame_index + 1
+            with self.condition:
+                if ok:
+                    self.cache[frame_index] = frame
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+                else:
+                    self.number_of_frames = min(self.number_of_frames, frame_index)
+                self.condition.notify_all()
+
+    def read(self, frame_index):
+        """Returns (ok, frame) of a frame, waiting for the thread to decode it if it is not cached"""
+        with self.condition:
+            self.cursor = frame_index
+            self.condition.notify_all()
+            while frame_index not in self.cache and frame_index < self.number_of_frames:
+                self.condition.wait()
+            if frame_index not in self.cache:
+                return False, None
+            self.cache.move_to_end(frame_index)
+            return True, self.cache[frame_index]
+
+    def close(self):
+        """Stops the thread"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+
 def read_video_frame(frame_index):
-    global video
-    video.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
-    ok, frame = video.read()
-    return ok, frame
+    """read video frame"""
+    global frame_provider
+    return frame_provider.read(frame_index)
 
 
 def read_frame(frame_index):
@@ -113,6 +196,8 @@ def usage(args):
     print("Output label file: " + args.output_file)
     if args.label_file != "":
         print("Input label file: " + args.label_file)
+    if args.journal_file != "":
+        print("Input journal file: " + args.journal_file)
     if args.fps != 200:
         print("video fps - label frequency: " + str(args.fps) + " images per second")
     print("Video begins at frame " + str(args.frame_index))
@@ -145,6 +230,15 @@ def parse_args(argv=None):
     parser.add_argument("-m", "--minimum_size", type=int, default=20,
                         help="Bbox minimum diagonal size in pixels. Default 20")
     parser.add_argument("--overwrite", help="if set overwrite output file if exists", action="store_true")
+    parser.add_argument("-j", "--journal_file", default="",
+                        help="Journal of an interrupted session ([output_filename]_journal.txt), replayed on top "
+                             "of the label file to recover it")
+    parser.add_argument("--autosave", type=float, default=10,
+                        help="Seconds between two flushes of the edited frames to the journal of the session, "
+                             "[output_filename]_journal.txt, removed once the output file is written")
+    parser.add_argument("--frame_cache", type=int, default=128,
+                        help="Number of decoded video frames kept in memory, the 32 frames after and before the "
+                             "current one are decoded in the background")
     args = parser.parse_args(argv)
 
     return args
@@ -154,7 +248,7 @@ def parse_args(argv=None):
 def main(args):
 
     image_dir = None
-    global video
+    global video, frame_provider
     video = None
 
     assert os.path.isfile(args.input), f"{args.input} is not a file\n," \
@@ -191,6 +285,7 @@ def main(args):
         number_of_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
         frame_width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
         frame_height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        frame_provider = VideoFrameProvider(video, args.frame_cache)
 
     elif image_dir:
         number_of_frames = len(image_dir)
@@ -219,6 +314,7 @@ def main(args):
     save_image = False
     window_title = 'labelling: ' + args.input
     bboxes_container = {}
+    prelabelled = {}  # (timestamp, bbox id) -> bbox of the boxes read from a prelabel.py file
 
     leave_labelling = False
     frame = np.zeros(shape=(0, 0))
@@ -239,6 +335,16 @@ def main(args):
 
         # reading labelling file
         bboxes_container = label.read_bboxes(args.label_file, [], timestep_us)
+        if label.is_prelabel_file(args.label_file):
+            for frame_time_idx, bboxes in bboxes_container.items():
+                for bbox_id, bbox in bboxes.items():
+                    prelabelled[frame_time_idx, bbox_id] = bbox["bbox"]
+
+    if args.journal_file != "":
+        assert os.path.exists(args.journal_file), "Could not open input journal file: {}. ".format(args.journal_file)
+        bboxes_container = label.BboxJournal.replay(args.journal_file, bboxes_container)
+
+    if args.label_file != "" or args.journal_file != "":
 
         # changing output name if input and output are the same
         if ((args.label_file == args.output_file) and (not args.overwrite)):
@@ -248,6 +354,10 @@ def main(args):
         bbox_next_available_id = 1
         for frame_time_idx, bboxes in bboxes_container.items():
             for bbox_id, bbox in bboxes.items():
+                # pre-labelled tracks are corrected by hand and never tracked, unless a replayed journal edited them
+                prelabelled_bbox = prelabelled.get((frame_time_idx, bbox_id))
+                bbox["prelabelled"] = prelabelled_bbox is not None and np.allclose(bbox["bbox"], prelabelled_bbox,
+                                                                                   atol=1e-3)
                 if bbox_id >= bbox_next_available_id:
                     bbox_next_available_id = bbox_id + 1
 
@@ -275,6 +385,19 @@ def main(args):
     frame_labelling_bboxes.update_bboxes_from_frame(bboxes_container, (frame_index + 1) * timestep_us)
     hide = False
 
+    # edited frames are journaled while labelling so that a crash does not lose the session. Only the replayed
+    # journal is appended to, the journal of another interrupted session is kept for recovery
+    journal_file = args.journal_file or os.path.splitext(args.output_file)[0] + "_journal.txt"
+    if journal_file != args.journal_file and os.path.exists(journal_file):
+        new_journal_file = os.path.splitext(
+            journal_file)[0] + "_" + datetime.datetime.now().strftime("%Y_%m_%d_%H-%M-%S") + ".txt"
+        print("Found the journal of an interrupted session, {}, journaling to {}".format(
+            journal_file, new_journal_file))
+        journal_file = new_journal_file
+    journal = label.BboxJournal(journal_file)
+    journal.flush(bboxes_container)
+    last_autosave = time.time()
+
     while not leave_labelling:
 
         # Read a new frame
@@ -326,6 +449,7 @@ def main(args):
         elif (key >= ord('0') and key <= ord('9')) or (key >= 176 and key <= 185):  # num pad
             frame_labelling_bboxes.update_bbox_id_from_keys(
                 key, bboxes_container, (frame_index + 1) * timestep_us, timestep_us)
+            journal.mark()  # ids and classes are changed across frames
 
         elif key == 32:  # space
             # doesnt allow auto play if drawing_state
@@ -348,14 +472,17 @@ def main(args):
 
         elif key == ord('U') or key == ord('u'):
             frame_labelling_bboxes.delete_all_bbox_with_id_of_selected(bboxes_container)
+            journal.mark()
 
         elif key == ord('O') or key == ord('o'):
             frame_labelling_bboxes.overwrite_all_futur_bbox_with_id_of_selected(
                 bboxes_container, (frame_index + 1) * timestep_us)
+            journal.mark()
 
         elif key == ord('S') or key == ord('s'):
             frame_labelling_bboxes.stop_tracking_selected_object(
                 bboxes_container, (frame_index + 1) * timestep_us, timestep_us)
+            journal.mark()
 
         elif key == ord('H') or key == ord('h'):
             hide = not hide
@@ -370,6 +497,7 @@ def main(args):
         elif key == ord('E') or key == ord('e'):
             frame_labelling_bboxes.autoplay = False
             frame_labelling_bboxes.save_current_bboxes(bboxes_container, (frame_index + 1) * timestep_us)
+            journal.mark((frame_index + 1) * timestep_us)
             frame_index -= frame_index > 0
             frame_labelling_bboxes.set_bbox_list_from_bboxes_container(bboxes_container,
                                                                        (frame_index + 1) * timestep_us)
@@ -379,6 +507,7 @@ def main(args):
             if (key == ord('R') or key == ord('r')) and frame_labelling_bboxes.autoplay:
                 frame_labelling_bboxes.autoplay = False
             frame_labelling_bboxes.save_current_bboxes(bboxes_container, (frame_index + 1) * timestep_us)
+            journal.mark((frame_index + 1) * timestep_us)
             frame_index += frame_index < number_of_frames - 1
             frame_labelling_bboxes.update_bboxes_from_frame(bboxes_container, (frame_index + 1) * timestep_us)
             print('frame {:d} out of {:d}'.format(frame_index + 1, number_of_frames))
@@ -392,15 +521,24 @@ def main(args):
             cv2.imwrite('image{:d}.png'.format(frame_index), frame)
             save_image = False
 
+        if time.time() - last_autosave > args.autosave:
+            journal.flush(bboxes_container)
+            last_autosave = time.time()
+
     frame_labelling_bboxes.save_current_bboxes(bboxes_container, (frame_index + 1) * timestep_us)
+    journal.mark((frame_index + 1) * timestep_us)
+    journal.flush(bboxes_container)
     label.write_bboxes(args.output_file, bboxes_container)
+    journal.close(remove=True)
+    if video:
+        frame_provider.close()
     print("exiting at frame " + str(frame_index))
     print("output label file in txt: " + args.output_file)
 
     # convert to NPY
     print('converting to NPY format: {}_bbox.npy'.format(args.output_file[:-4]))
-    lines = open(args.output_file, "r").readlines()
-    bboxes_array = bboxstr2array(lines)
+    with open(args.output_file, "r") as file:
+        bboxes_array = bboxstr2array(file)
     np.save(args.output_file[:-4] + "_bbox.npy", bboxes_array)
 
 
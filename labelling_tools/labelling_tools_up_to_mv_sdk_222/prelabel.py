@@ -0,0 +1,121 @@
+# Copyright (c) Prophesee S.A.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software distributed under the License is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and limitations under the License.
+"""
+Tool to pre-label *.h5 event recordings offline with a trained YOLO model and ByteTrack into BB_* label files,
+to be corrected with label_tracking.py
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import label
+from ultralytics import YOLO
+from ultralytics.data.utils import EVENTS_DEFAULTS
+
+
+def prelabel(model, input_filename, output_filename, histo_delta_t=EVENTS_DEFAULTS["histo_delta_t"],
+             label_delta_t=EVENTS_DEFAULTS["label_delta_t"], **kwargs):
+    """Tracks the objects of a recording and writes them as a BB_* label file
+
+    The histograms of the recording are read every label_delta_t and run through the model in batches, the detections
+    are then associated frame by frame by the tracker. Frame k is labelled at ts = (k + 1) * label_delta_t, as
+    expected by label_tracking.py with fps = 1000000 / label_delta_t.
+
+    Args:
+        model: YOLO detection model
+        input_filename: *.h5 recording of event histograms
+        output_filename: output label file
+        histo_delta_t: time span of one histogram of the recording (us)
+        label_delta_t: time between labelled frames (us)
+        kwargs: arguments of model.track(), i.e. batch, imgsz, conf, device or tracker, bytetrack.yaml by default
+
+    Returns:
+        number of frames and number of tracks written
+    """
+    bboxes = {}
+    track_ids = set()
+    vid_stride = max(label_delta_t // histo_delta_t, 1)
+    kwargs = {"tracker": "bytetrack.yaml", **kwargs}
+    results = model.track(input_filename, stream=True, vid_stride=vid_stride, verbose=False, **kwargs)
+    for k, result in enumerate(results):
+        frame = bboxes[(k + 1) * label_delta_t] = {}
+        boxes = result.boxes.cpu().numpy()
+        if boxes.id is None:  # no tracked object
+            continue
+        for (x1, y1, x2, y2), track_id, class_id, probability in zip(boxes.xyxy, boxes.id, boxes.cls, boxes.conf):
+            frame[int(track_id)] = {"class_id": int(class_id),
+                                    "bbox": (x1, y1, x2 - x1, y2 - y1),
+                                    "probability": probability}
+            track_ids.add(int(track_id))
+    label.write_bboxes(output_filename, bboxes, header=label.PRELABEL_HEADER)
+    return len(bboxes), len(track_ids)
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Pre-label event recordings with a YOLO model and ByteTrack",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-m", "--model", required=True, help="Trained YOLO detection model (.pt)")
+    parser.add_argument("-i", dest="input_filename", required=True,
+                        help="Input *.h5 recording, or directory of *.h5 recordings")
+    parser.add_argument("-o", dest="output_filename", default="",
+                        help="Output label filename, or output directory of the [input_filename]_labels.txt files. "
+                        "By default, [input_filename]_labels.txt next to the input")
+    parser.add_argument("--histo_delta_t", type=int, default=EVENTS_DEFAULTS["histo_delta_t"],
+                        help="Time span of one histogram of the recordings (us)")
+    parser.add_argument("--label_delta_t", type=int, default=EVENTS_DEFAULTS["label_delta_t"],
+                        help="Time between labelled frames (us), open the label file with -f 1000000/label_delta_t")
+    parser.add_argument("-b", "--batch", type=int, default=64, help="Number of frames per inference batch")
+    parser.add_argument("--imgsz", type=int, default=640, help="Inference image size")
+    parser.add_argument("--conf", type=float, default=0.1, help="Detection confidence threshold")
+    parser.add_argument("--tracker", default="bytetrack.yaml", help="Tracker configuration")
+    parser.add_argument("--device", default="", help="Inference device, i.e. 0 or cpu")
+    args = parser.parse_args(argv)
+    if os.path.isdir(args.input_filename):
+        args.output_filename = args.output_filename or args.input_filename
+        assert not os.path.isfile(args.output_filename), "Output should be a directory"
+        return args
+    assert os.path.isfile(args.input_filename)
+    args.output_filename = args.output_filename or os.path.splitext(args.input_filename)[0] + "_labels.txt"
+    assert not os.path.exists(args.output_filename), "Output filename already exists"
+    return args
+
+
+def process_args(args):
+    """Process command line arguments"""
+    if os.path.isdir(args.input_filename):
+        os.makedirs(args.output_filename, exist_ok=True)
+        filenames = []
+        for input_filename in sorted(glob.glob(os.path.join(args.input_filename, "*.h5"))):
+            name = os.path.splitext(os.path.basename(input_filename))[0]
+            output_filename = os.path.join(args.output_filename, name + "_labels.txt")
+            if os.path.exists(output_filename):
+                print("Skipping {}, {} already exists".format(input_filename, output_filename))
+            else:
+                filenames.append((input_filename, output_filename))
+    else:
+        filenames = [(args.input_filename, args.output_filename)]
+    model = YOLO(args.model)
+    for input_filename, output_filename in filenames:
+        num_frames, num_tracks = prelabel(model, input_filename, output_filename, args.histo_delta_t,
+                                          args.label_delta_t, batch=args.batch, imgsz=args.imgsz, conf=args.conf,
+                                          tracker=args.tracker, device=args.device or None)
+        print("Saved {}: {} tracks over {} frames".format(output_filename, num_tracks, num_frames))
+
+
+def main():
+    """Main function"""
+    args = parse_args(sys.argv[1:])
+    process_args(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 # Ultralytics YOLO 🚀, AGPL-3.0 license
 
 import contextlib
+import pickle
 from copy import copy
 from pathlib import Path
 
@@ -231,7 +232,7 @@ def test_all_model_yamls():
 
 def test_workflow():
     model = YOLO(MODEL)
-    model.train(data='coco8.yaml', epochs=1, imgsz=32, optimizer='SGD')
+    model.train(data='coco8.yaml', epochs=1, imgsz=32, optimizer='SGD', prefetch=True)
     model.val(imgsz=32)
     model.predict(SOURCE, imgsz=32)
     model.export(format='onnx')  # export a model to ONNX format
@@ -303,6 +304,252 @@ def test_data_converter():
     coco80_to_coco91_class()
 
 
+def test_data_h5_pool():
+    # Test the per-worker LRU pool of *.h5 file handles
+    import h5py
+
+    from ultralytics.data.utils import H5FilePool
+
+    files = [str(TMP / f'pool{i}.h5') for i in range(3)]
+    for f in files:
+        with h5py.File(f, 'w') as h5:
+            h5.create_dataset('data', data=np.zeros((2, 2, 8, 8), dtype=np.uint8))
+    pool = H5FilePool(max_open=2)
+    for f in files + files[-1:]:
+        assert pool.get(f)['data'].shape == (2, 2, 8, 8)
+    assert pool.stats['hits'] == 1 and pool.stats['misses'] == 3 and pool.stats['evictions'] == 1 and len(pool) == 2
+    pool._pid = -1  # simulate a forked worker, inherited handles must not be reused
+    pool.get(files[0])
+    assert pool.stats['misses'] == 1 and len(pool) == 1
+    pool.close()
+
+
+def make_events_dataset(root, nrec=2, n=24, h=48, w=64):
+    """Create a tiny event dataset with *.h5 histograms and *_bbox.npy labels labelled every 1e5 us."""
+    import h5py
+
+    dtype = np.dtype([('ts', '<i8'), ('x', '<f4'), ('y', '<f4'), ('w', '<f4'), ('h', '<f4'), ('class_id', '<u4'),
+                      ('track_id', '<u4'), ('class_confidence', '<f4')])
+    for split in 'train', 'val':
+        (root / split).mkdir(parents=True, exist_ok=True)
+        for r in range(nrec):
+            with h5py.File(root / split / f'rec{r}.h5', 'w') as f:
+                f.create_dataset('data', data=np.random.randint(0, 3, (n, 2, h, w), np.uint8), chunks=(4, 2, h, w))
+            lb = [((k + 1) * 100000, 4 * k % (w - 16), 8, 12, 10, k % 2, 0, 1.0) for k in range(n // 2) if k % 3]
+            np.save(root / split / f'rec{r}_bbox.npy', np.array(lb, dtype=dtype))
+    data = {'path': str(root), 'train': str(root / 'train'), 'val': str(root / 'val'), 'names': {0: 'a', 1: 'b'}}
+    return data
+
+
+def test_data_events_labels():
+    # Test the cached, vectorized label index of event recordings
+    from ultralytics.data import YOLODataset
+
+    data = make_events_dataset(TMP / 'events_labels')
+    for _ in range(2):  # build, then load from *.cache
+        dataset = YOLODataset(data['train'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+        assert len(dataset) == 2 * 8 and (TMP / 'events_labels' / 'train.cache').exists()
+        assert dataset.labels[1]['im_file'] == [0, 4] and dataset.labels[1]['cls'].dtype == np.float32
+        assert dataset[0]['img'].shape == (2, 64, 64)
+    frame = dataset.read_frame(*dataset.labels[0]['im_file'])
+    assert (dataset[0]['img'][:, 8:56].numpy() == frame).all()  # letterboxed, (positive, negative) order kept
+
+    # Temporal binning from the data YAML, labels 1us off the grid and every 2nd labelled frame
+    for f in (TMP / 'events_labels' / 'train').glob('*_bbox.npy'):
+        lb = np.load(f)
+        lb['ts'] += 1
+        np.save(f, lb)
+    data.update(label_tolerance=1, frame_stride=2, histo_delta_t=100000)
+    dataset = YOLODataset(data['train'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    assert [lb['im_file'] for lb in dataset.labels[:3]] == [[0, 2], [0, 4], [0, 8]]
+
+
+def test_data_chunk_locality_sampler():
+    # Test block-level shuffling with slab reads of event recordings
+    from ultralytics.data import YOLODataset, build_dataloader
+    from ultralytics.data.build import ChunkLocalitySampler
+
+    data = {**make_events_dataset(TMP / 'events_slab'), 'slab_size': 8}
+    dataset = YOLODataset(data['train'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    loader = build_dataloader(dataset, batch=4, workers=0, shuffle=True)
+    sampler = loader.sampler
+    assert isinstance(sampler, ChunkLocalitySampler)
+    order = list(sampler)
+    assert sorted(order) == list(range(len(dataset))) and order != list(sampler)  # permutation, new every epoch
+    blocks = [(dataset.labels[i]['im_file'][0], dataset.labels[i]['im_file'][1] // 8) for i in order]
+    assert sum(a != b for a, b in zip(blocks, blocks[1:])) == len(sampler.blocks) - 1  # blocks are contiguous
+    file_idx, frame_idx = dataset.labels[order[0]]['im_file']
+    assert dataset.read_frame(file_idx, frame_idx).shape == (2, 48, 64) and dataset.slab[1] == frame_idx // 8 * 8
+    assert next(iter(loader))['img'].shape == (4, 2, 64, 64)
+
+
+def test_data_events_cache():
+    # Test RAM and disk caching of event frames, served without touching *.h5 files
+    from ultralytics.data import YOLODataset
+
+    data = make_events_dataset(TMP / 'events_cache')
+    ref = YOLODataset(data['val'], imgsz=32, augment=False, rect=True, hyp=copy(DEFAULT_CFG), data=data)
+    for cache in 'ram', 'disk', 'disk':  # disk twice to reuse the *.npy blob
+        dataset = YOLODataset(data['val'], imgsz=32, cache=cache, augment=False, rect=True, hyp=copy(DEFAULT_CFG),
+                              data=data)
+        assert dataset.arena.size == dataset.arena_offsets[-1] == 16 * 2 * 24 * 32
+        dataset.h5_pool.close()
+        for i in range(len(dataset)):
+            im, hw0, hw, _ = dataset.load_image(i)
+            assert (im == ref.load_image(i)[0]).all() and hw0 == (48, 64) and hw == (24, 32)
+        assert len(dataset.h5_pool) == 0
+    assert len(list((TMP / 'events_cache').glob('val.*.npy'))) == 1
+
+    # RAM cache lives in shared memory, later datasets and unpickled copies attach to the same segment
+    kwargs = dict(imgsz=32, cache='ram', augment=False, rect=True, hyp=copy(DEFAULT_CFG), data=data)
+    a, b = YOLODataset(data['val'], **kwargs), YOLODataset(data['val'], **kwargs)
+    c = pickle.loads(pickle.dumps(a))
+    assert a.arena.owner and not b.arena.owner and b.arena.ready and b.arena.name == c.arena.name
+    assert (c.arena[:] == a.arena[:]).all()
+
+    # *.h5 shapes are read once for the RAM check and the arena
+    calls, frame_shapes = [], YOLODataset.frame_shapes
+    YOLODataset.frame_shapes = lambda self: calls.append(self) or frame_shapes(self)
+    try:
+        YOLODataset(data['val'], **kwargs)
+    finally:
+        YOLODataset.frame_shapes = frame_shapes
+    assert len(calls) == 1
+
+
+def test_data_events_store():
+    # Test converting event recordings to a memory-mapped store, plain and bit-packed
+    import h5py
+
+    from ultralytics.data import YOLODataset
+    from ultralytics.data.converter import convert_events_to_store
+
+    data = make_events_dataset(TMP / 'events_store')
+    ref = YOLODataset(data['val'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    store = convert_events_to_store(data['val'])
+    dataset = YOLODataset(str(store), imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    assert len(dataset) == len(ref) and dataset.store is not None
+    for i in range(len(dataset)):
+        a, b = dataset[i], ref[i]
+        assert (a['img'] == b['img']).all() and (a['cls'] == b['cls']).all() and (a['bboxes'] == b['bboxes']).all()
+    with pytest.raises(ValueError):  # only binarized histograms can be bit-packed
+        convert_events_to_store(data['val'], TMP / 'events_store' / 'packed', packbits=True)
+
+    ref.h5_pool.close()
+    for f in Path(data['val']).glob('*.h5'):
+        with h5py.File(f, 'r+') as h5:
+            h5['data'][:] = h5['data'][:] > 0
+    store = convert_events_to_store(data['val'], TMP / 'events_store' / 'packed', packbits=True)
+    dataset = YOLODataset(str(store), imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    assert np.load(store / 'frames.npy', mmap_mode='r').shape == (48, 2, 48, 8)
+    with h5py.File(Path(data['val']) / 'rec1.h5') as h5:
+        assert (dataset.read_frame(1, 5) == h5['data'][5]).all()
+
+    # Degenerate, out of frame and invalid class boxes are dropped as by the label index
+    f = Path(data['train']) / 'rec0_bbox.npy'
+    lb = np.load(f)
+    bad = np.repeat(lb[:1], 3)
+    bad['w'][0], bad['x'][1], bad['class_id'][2] = 0, 64, 2
+    np.save(f, np.concatenate((lb, bad)))
+    ref = YOLODataset(data['train'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    store = convert_events_to_store(data['train'], num_cls=2)
+    dataset = YOLODataset(str(store), imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    assert len(np.load(store / 'labels.npz')['cls']) == sum(len(x['cls']) for x in ref.labels) == 2 * len(lb)
+    assert len(dataset) == len(ref)
+    for a, b in zip(dataset.labels, ref.labels):
+        assert (a['cls'] == b['cls']).all() and (a['bboxes'] == b['bboxes']).all()
+
+
+def test_data_events_packbits():
+    # Test batching bit-packed binarized histograms and unpacking them on the device
+    from ultralytics.data import YOLODataset, build_dataloader
+    from ultralytics.utils.ops import unpackbits
+
+    data = make_events_dataset(TMP / 'events_packbits')
+    kwargs = dict(imgsz=64, augment=False, hyp=copy(DEFAULT_CFG))
+    ref = next(iter(build_dataloader(YOLODataset(data['val'], data=data, **kwargs), 4, 0, shuffle=False)))['img']
+    data['packbits'] = True
+    img = next(iter(build_dataloader(YOLODataset(data['val'], data=data, **kwargs), 4, 0, shuffle=False)))['img']
+    assert img.shape == (4, 2, 64, 8) and img.dtype == torch.uint8
+    assert torch.equal(unpackbits(img), (ref > 0).float() / 255)
+
+
+def test_predict_events_source():
+    # Test streaming *.h5 recordings as batches of frames for inference
+    import h5py
+
+    data = make_events_dataset(TMP / 'events_predict')
+    source = Path(data['val']) / 'rec0.h5'
+    dataset = load_inference_source(source=source, vid_stride=2, batch=5)
+    assert dataset.source_type.events and len(dataset) == 1
+    batches = list(dataset)
+    assert [len(x[1]) for x in batches] == [5, 5, 2] and dataset.frames == [12]
+    with h5py.File(source) as h5:
+        assert (batches[1][1][0] == h5['data'][10].transpose(1, 2, 0)).all()
+    assert list(dataset.batch_frames) == [20, 22] and dataset.frame == 12
+    model = YOLO(CFG)
+    model(source, imgsz=64, batch=8)
+    assert model.predictor.preprocess([np.zeros((64, 64, 2), np.uint8)] * 2).is_contiguous()  # BCHW memory
+    dataset = load_inference_source(source=data['val'], vid_stride=2, batch=5)  # directory of recordings
+    assert dataset.source_type.events and len(dataset) == 2
+    assert [len(x[1]) for x in dataset] == [5, 5, 2] * 2 and dataset.frames == [12, 12]
+
+
+def test_track_events_source():
+    # Test that batches of consecutive frames of a recording are tracked in order by a single tracker
+    data = make_events_dataset(TMP / 'events_track')
+    model = YOLO(CFG)
+    source = Path(data['val']) / 'rec0.h5'
+    results = model.track(source, imgsz=64, batch=5, vid_stride=2, tracker='bytetrack.yaml')
+    assert len(results) == 12 and len(model.predictor.trackers) == 1
+    assert model.predictor.tracked_file == str(source)
+    assert model.predictor.trackers[0].frame_id == 12  # updated on every frame, with or without detections
+
+
+def test_data_batch_augment():
+    # Test batched augmentation against cv2 warps and per-image box transforms of RandomPerspective
+    from ultralytics.data.augment import BatchRandomPerspective, RandomPerspective
+    from ultralytics.utils.ops import xywh2xyxy
+
+    t = BatchRandomPerspective(degrees=10, shear=5, perspective=0.0005, flipud=0.5, fliplr=0.5)
+    img, (b, h, w) = torch.rand(4, 2, 48, 64), (4, 48, 64)
+    M, s = t.get_matrices(b, h, w)
+    t.get_matrices = lambda *args: (M, s)
+    bboxes = torch.tensor([[0.5, 0.5, 0.3, 0.3], [0.2, 0.3, 0.1, 0.2], [0.5, 0.5, 0.5, 0.5]])
+    batch = t({'img': img, 'bboxes': bboxes, 'cls': torch.zeros(3, 1), 'batch_idx': torch.tensor([0.0, 1.0, 3.0])})
+    rp, gain = RandomPerspective(perspective=0.0005), torch.tensor((w, h, w, h))
+    for i in range(b):
+        warped = [cv2.warpPerspective(x.numpy(), M[i].numpy(), dsize=(w, h), borderValue=114 / 255) for x in img[i]]
+        assert np.allclose(np.stack(warped)[:, 1:-1, 1:-1], batch['img'][i, :, 1:-1, 1:-1].numpy(), atol=1e-3)
+    for j, box in zip(batch['batch_idx'].long(), xywh2xyxy(bboxes) * gain):
+        ref = rp.apply_bboxes(box[None].numpy(), M[j].numpy()).clip(0, gain.numpy())
+        assert np.allclose(ref, xywh2xyxy(batch['bboxes'][batch['batch_idx'] == j]) * gain, atol=1e-3)
+
+
+def test_data_letterbox_fused():
+    # Test RandomPerspective with a fused LetterBox against LetterBox followed by RandomPerspective
+    import random
+
+    from ultralytics.data.augment import LetterBox, RandomPerspective
+    from ultralytics.utils.instance import Instances
+
+    def labels():
+        bboxes = np.array([[0.5, 0.5, 0.3, 0.4], [0.2, 0.3, 0.1, 0.2]], dtype=np.float32)
+        return {
+            'img': np.full((120, 160, 2), 255, dtype=np.uint8),
+            'cls': np.zeros((2, 1)),
+            'instances': Instances(bboxes, np.zeros((0, 1000, 2), dtype=np.float32), bbox_format='xywh')}
+
+    args = dict(degrees=10, shear=2, perspective=0.0005)
+    random.seed(0)
+    fused = RandomPerspective(**args, pre_transform=LetterBox(new_shape=(96, 96)))(labels())
+    random.seed(0)
+    ref = RandomPerspective(**args)(LetterBox(new_shape=(96, 96))(labels()))
+    assert fused['img'].shape == ref['img'].shape == (96, 96, 2)
+    assert np.allclose(fused['instances'].bboxes, ref['instances'].bboxes, atol=1e-3)
+    assert (fused['cls'] == ref['cls']).all()
+
+
 def test_data_annotator():
     from ultralytics.data.annotator import auto_annotate
 
@@ -447,3 +694,210 @@ def test_hub():
     export_fmts_hub()
     logout()
     smart_request('GET', 'http://github.com', progress=True)
+
+
+def test_data_events_raw():
+    # Test histograms built on read from raw (x, y, p, t) events against precomputed *.h5 histograms
+    import h5py
+
+    from ultralytics.data import YOLODataset
+    from ultralytics.data.utils import EventHistograms
+
+    data = make_events_dataset(TMP / 'events_raw', nrec=1, n=24)
+    n, dt, (h, w) = 24, 50000, (48, 64)
+    t = np.sort(np.random.randint(0, n * dt, 20000))
+    x, y, p = np.random.randint(0, w, len(t)), np.random.randint(0, h, len(t)), np.random.randint(0, 2, len(t))
+    for split in 'train', 'val':
+        ref = np.zeros((n, 2, h, w), dtype=np.int64)
+        np.add.at(ref, (t // dt, p, y, x), 1)
+        with h5py.File(TMP / 'events_raw' / split / 'rec0.h5', 'w') as f:  # precomputed histograms
+            f.create_dataset('data', data=ref.astype(np.uint8))
+        with h5py.File(TMP / 'events_raw' / split / 'rec1.h5', 'w') as f:  # raw events of the same recording
+            for k, v in zip('xypt', (x.astype(np.uint16), y.astype(np.uint16), p.astype(np.uint8), t)):
+                f.create_dataset(f'events/{k}', data=v)
+            f['events'].attrs.update(height=h, width=w)
+            f.create_dataset('ms_to_idx', data=np.searchsorted(t, np.arange(0, t[-1] + 1, 1000)))
+        np.save(TMP / 'events_raw' / split / 'rec1_bbox.npy', np.load(TMP / 'events_raw' / split / 'rec0_bbox.npy'))
+
+    dataset = YOLODataset(data['train'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    assert len(dataset) == 2 * 8 and dataset.frames(0).shape == dataset.frames(1).shape
+    for i in range(8):
+        assert (dataset.load_image(i)[0] == dataset.load_image(i + 8)[0]).all()
+
+    # Window, clipping and binarization
+    with h5py.File(TMP / 'events_raw' / 'train' / 'rec1.h5', 'r') as f:
+        frames = EventHistograms(f, dt, window=2 * dt, clip=1)[1:10:3]
+    assert frames.shape == (3, 2, h, w) and frames.max() == 1
+    assert (frames == ((ref[0:9:3] + ref[1:10:3]) > 0)).all()
+
+
+def test_data_events_temporal_stack():
+    # Test stacking of consecutive histograms in datasets, with and without slabs, and in the streaming loader
+    from ultralytics.data import YOLODataset
+    from ultralytics.data.loaders import LoadEventHistograms
+
+    data = {**make_events_dataset(TMP / 'events_stack', nrec=1), 'temporal_stack': 3}
+    dataset = YOLODataset(data['train'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    ref = dataset.frames(0)[:]
+    stacked = np.concatenate((np.zeros((2, *ref.shape[1:]), dtype=np.uint8), ref))  # zero history before frame 0
+    for frame_idx in 0, 1, 2, 9, 23:
+        assert (dataset.read_frame(0, frame_idx) == stacked[frame_idx:frame_idx + 3].reshape(6, 48, 64)).all()
+    assert dataset[0]['img'].shape == (6, 64, 64)
+    dataset.slab_size = 8
+    assert all((dataset.read_frame(0, i) == stacked[i:i + 3].reshape(6, 48, 64)).all() for i in range(24))
+
+    loader = LoadEventHistograms(data['train'], imgsz=64, vid_stride=2, batch=5, ch=6)
+    ims = [im for _, batch, _, _ in loader for im in batch]  # (h, w, c) frames 0, 2, ...
+    assert len(ims) == 12
+    assert all((im.transpose(2, 0, 1) == dataset.read_frame(0, 2 * i)).all() for i, im in enumerate(ims))
+
+
+def test_data_events_label_views():
+    # Test that samples share label arrays read-only with the dataset and transforms copy them on write
+    from ultralytics.data import YOLODataset
+
+    data = make_events_dataset(TMP / 'events_views', nrec=1)
+    hyp = copy(DEFAULT_CFG)
+    hyp.fliplr = hyp.flipud = 0.5
+    dataset = YOLODataset(data['train'], imgsz=64, augment=True, hyp=hyp, data=data)
+    bboxes = [lb['bboxes'].copy() for lb in dataset.labels]
+    label = dataset.get_image_and_label(0)
+    assert np.shares_memory(label['instances'].bboxes, dataset.labels[0]['bboxes'])
+    assert not label['instances'].bboxes.flags.writeable
+    for _ in range(3):
+        for i in range(len(dataset)):
+            dataset[i]
+    assert all((lb['bboxes'] == b).all() for lb, b in zip(dataset.labels, bboxes))
+
+
+def test_data_collate():
+    # Test the collate of event samples into one batch
+    from ultralytics.data import YOLODataset
+
+    data = make_events_dataset(TMP / 'events_collate', nrec=1)
+    dataset = YOLODataset(data['train'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    samples = [dataset[i] for i in range(4)]
+    batch = YOLODataset.collate_fn(samples)
+    assert torch.equal(batch['img'], torch.stack([x['img'] for x in samples]))
+    assert torch.equal(batch['batch_idx'], torch.cat([x['batch_idx'] + i for i, x in enumerate(samples)]))
+    assert batch['bboxes'].shape == (len(batch['batch_idx']), 4) and len(batch['im_file']) == 4
+
+
+def test_data_device_prefetcher():
+    # Test that prefetched batches arrive preprocessed and in order, also when the consumer stops early
+    from ultralytics.data import DevicePrefetcher
+
+    loader = torch.utils.data.DataLoader(torch.arange(10), batch_size=2)
+    prefetcher = DevicePrefetcher(loader, lambda x: x * 2, 'cpu', depth=2)
+    assert len(prefetcher) == 5
+    assert [x.tolist() for x in prefetcher] == [[0, 2], [4, 6], [8, 10], [12, 14], [16, 18]]
+    assert prefetcher.wait >= 0 and prefetcher.t > 0
+    for i, x in enumerate(prefetcher):
+        if i == 1:
+            break
+    assert x.tolist() == [4, 6] and [len(x) for x in prefetcher] == [2] * 5
+
+
+def test_data_recording_shard_sampler():
+    # Test that ranks and workers read disjoint, balanced recording shards, reassigned every epoch
+    from ultralytics.data import YOLODataset, build_dataloader
+    from ultralytics.data.build import RecordingShardSampler
+
+    data = {**make_events_dataset(TMP / 'events_shard', nrec=4), 'shard_recordings': True, 'shard_size': 8}
+    dataset = YOLODataset(data['train'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+    sampler = build_dataloader(dataset, batch=2, workers=0).sampler
+    assert isinstance(sampler, RecordingShardSampler) and len(sampler.units) == 4 * 3  # 24 frames in blocks of 8
+    assignments = []
+    for epoch in range(3):
+        files, samples = [], []
+        for rank in range(2):
+            sampler = RecordingShardSampler(dataset, 2, workers=2, num_replicas=2, rank=rank)
+            sampler.set_epoch(epoch)
+            order = np.array(list(sampler)).reshape(-1, 2, 2)  # (step, worker, batch)
+            assert len(sampler) == order.size == len(dataset) // 2
+            files.extend({dataset.labels[i]['im_file'][0] for i in order[:, w].ravel()} for w in range(2))
+            samples.extend(order.ravel().tolist())
+        assert [len(f) for f in files] == [1] * 4 and sorted(samples) == list(range(len(dataset)))  # disjoint shards
+        assignments.append(files)
+    assert any(a != assignments[0] for a in assignments[1:])  # reassigned
+
+
+def test_data_events_scan():
+    # Test the verification report of event recordings, kept in the *.cache
+    import h5py
+
+    from ultralytics.data import YOLODataset
+    from ultralytics.data.dataset import load_dataset_cache_file
+
+    data = make_events_dataset(TMP / 'events_scan', nrec=3)
+    lb = np.load(TMP / 'events_scan' / 'train' / 'rec0_bbox.npy')
+    lb = np.concatenate((lb, lb[:2], lb[:1]))
+    lb['w'][-3], lb['class_id'][-2], lb['ts'][-1] = 0, 2, 10 ** 7  # degenerate, invalid class, past the last frame
+    np.save(TMP / 'events_scan' / 'train' / 'rec0_bbox.npy', lb)
+    with h5py.File(TMP / 'events_scan' / 'train' / 'rec2.h5', 'w') as f:
+        f.create_dataset('data', data=np.zeros((4, 3, 48, 64), np.uint8))  # 3 channels
+    for _ in range(2):  # scan, then load from *.cache
+        dataset = YOLODataset(data['train'], imgsz=64, augment=False, hyp=copy(DEFAULT_CFG), data=data)
+        assert len(dataset) == 8 * 2
+    report = load_dataset_cache_file(TMP / 'events_scan' / 'train.cache')['report']
+    assert report['dropped'].tolist() == [3, 0, 0] and report['corrupt'].tolist() == [0, 0, 1]
+    assert report['unlabelled'].tolist() == [4, 4, 0] and report['boxes'].tolist() == [8, 8, 0]
+
+
+def test_data_event_mosaic():
+    # Test that the event mosaic matches Mosaic with a zero fill while reusing its canvas
+    import random
+
+    from ultralytics.data import YOLODataset
+    from ultralytics.data.augment import EventMosaic, Mosaic
+
+    data = {**make_events_dataset(TMP / 'events_mosaic'), 'slab_size': 8}
+    dataset = YOLODataset(data['train'], imgsz=64, augment=True, hyp=copy(DEFAULT_CFG), data=data)
+    event_mosaic, mosaic = EventMosaic(dataset, imgsz=64), Mosaic(dataset, imgsz=64)
+    for indexes in (0, 1, 2, 3), (4, 9, 10, 15):
+        out = []
+        for transform in event_mosaic, mosaic:
+            labels = dataset.get_image_and_label(indexes[0])
+            labels['mix_labels'] = [dataset.get_image_and_label(i) for i in indexes[1:]]
+            random.seed(indexes[1])
+            out.append(transform._mix_transform(labels))
+        assert out[0]['img'] is event_mosaic.canvas  # reused, regions of the previous mosaic cleared
+        assert (out[0]['img'] == np.where(out[1]['img'] == 114, 0, out[1]['img'])).all()
+        assert np.allclose(out[0]['instances'].bboxes, out[1]['instances'].bboxes)
+        assert (out[0]['cls'] == out[1]['cls']).all()
+    file_idx, frame_idx = dataset.labels[5]['im_file']
+    dataset.read_frame(file_idx, frame_idx)
+    tiles = [dataset.labels[i]['im_file'] for i in event_mosaic.get_indexes()]
+    assert all(f == file_idx and k // 8 == frame_idx // 8 for f, k in tiles)  # tiles of the slab in memory
+    assert dataset[0]['img'].shape == (2, 64, 64)
+
+    # batch_augment keeps the mosaic, cropped to imgsz as the batch is warped later
+    crop = EventMosaic(dataset, imgsz=64, crop=True)
+    out = []
+    for transform in event_mosaic, crop:
+        labels = dataset.get_image_and_label(0)
+        labels['mix_labels'] = [dataset.get_image_and_label(i) for i in (4, 9, 10)]
+        random.seed(0)
+        out.append(transform._mix_transform(labels))
+    assert (out[1]['img'] == out[0]['img'][32:96, 32:96]).all() and out[1]['img'].base is not crop.canvas
+    boxes = (out[0]['instances'].bboxes - 32).clip(0, 64)
+    assert np.allclose(out[1]['instances'].bboxes, boxes[(boxes[:, 2:] > boxes[:, :2]).all(1)])
+    hyp = copy(DEFAULT_CFG)
+    hyp.batch_augment = True
+    assert isinstance(YOLODataset(data['train'], imgsz=64, augment=True, hyp=hyp, data=data).transforms.transforms[0],
+                      EventMosaic)
+
+    # Without cache or slab, tiles are the last samples kept in memory instead of frames read again
+    data.pop('slab_size')
+    dataset = YOLODataset(data['train'], imgsz=64, augment=True, hyp=copy(DEFAULT_CFG), data=data)
+    event_mosaic, reads = EventMosaic(dataset, imgsz=64), []
+    read_frame = dataset.read_frame
+    dataset.read_frame = lambda *args: reads.append(args) or read_frame(*args)
+    for i in range(6):
+        event_mosaic(dataset.get_image_and_label(i))
+    assert len(reads) == 6 + 3 * 3 and len(event_mosaic.resident) == 6  # tiles read by the first 3 mosaics only
+
+    # Cached frames are never added to the buffer, the segment and keypoint Mosaic draws any frame
+    dataset = YOLODataset(data['train'], imgsz=64, cache='ram', augment=True, hyp=copy(DEFAULT_CFG), data=data)
+    dataset.get_image_and_label(0)
+    assert not dataset.buffer and all(0 <= i < len(dataset) for i in Mosaic(dataset, imgsz=64).get_indexes())
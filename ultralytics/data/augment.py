@@ -2,6 +2,7 @@
 
 import math
 import random
+from collections import deque
 from copy import deepcopy
 
 import cv2
@@ -13,7 +14,7 @@ from ultralytics.utils import LOGGER, colorstr
 from ultralytics.utils.checks import check_version
 from ultralytics.utils.instance import Instances
 from ultralytics.utils.metrics import bbox_ioa
-from ultralytics.utils.ops import segment2box
+from ultralytics.utils.ops import segment2box, xywh2xyxy, xyxy2xywh
 
 from .utils import polygons2masks, polygons2masks_overlap
 
@@ -133,8 +134,8 @@ class Mosaic(BaseMixTransform):
         self.n = n
 
     def get_indexes(self, buffer=True):
-        """Return a list of random indexes from the dataset."""
-        if buffer:  # select images from buffer
+        """Return a list of random indexes from the dataset, any index if frames are cached and the buffer is unused."""
+        if buffer and self.dataset.arena is None:  # select images from buffer
             return random.choices(list(self.dataset.buffer), k=self.n - 1)
         else:  # select any images
             return [random.randint(0, len(self.dataset) - 1) for _ in range(self.n - 1)]
@@ -159,17 +160,7 @@ class Mosaic(BaseMixTransform):
             # Place img in img4
             if i == 0:  # top left
                 img4 = np.full((s * 2, s * 2, img.shape[2]), 114, dtype=np.uint8)  # base image with 4 tiles
-                x1a, y1a, x2a, y2a = max(xc - w, 0), max(yc - h, 0), xc, yc  # xmin, ymin, xmax, ymax (large image)
-                x1b, y1b, x2b, y2b = w - (x2a - x1a), h - (y2a - y1a), w, h  # xmin, ymin, xmax, ymax (small image)
-            elif i == 1:  # top right
-                x1a, y1a, x2a, y2a = xc, max(yc - h, 0), min(xc + w, s * 2), yc
-                x1b, y1b, x2b, y2b = 0, h - (y2a - y1a), min(w, x2a - x1a), h
-            elif i == 2:  # bottom left
-                x1a, y1a, x2a, y2a = max(xc - w, 0), yc, xc, min(s * 2, yc + h)
-                x1b, y1b, x2b, y2b = w - (x2a - x1a), 0, w, min(y2a - y1a, h)
-            elif i == 3:  # bottom right
-                x1a, y1a, x2a, y2a = xc, yc, min(xc + w, s * 2), min(s * 2, yc + h)
-                x1b, y1b, x2b, y2b = 0, 0, min(w, x2a - x1a), min(y2a - y1a, h)
+            (x1a, y1a, x2a, y2a), (x1b, y1b, x2b, y2b) = self._tile4(i, xc, yc, w, h, s)
 
             img4[y1a:y2a, x1a:x2a] = img[y1b:y2b, x1b:x2b]  # img4[ymin:ymax, xmin:xmax]
             padw = x1a - x1b
@@ -181,6 +172,24 @@ class Mosaic(BaseMixTransform):
         final_labels['img'] = img4
         return final_labels
 
+    @staticmethod
+    def _tile4(i, xc, yc, w, h, s):
+        """Return the xyxy region of tile `i` of a 2x2 mosaic of size 2 * s centered at (xc, yc) and of the w x h
+        image placed there."""
+        if i == 0:  # top left
+            x1a, y1a, x2a, y2a = max(xc - w, 0), max(yc - h, 0), xc, yc  # xmin, ymin, xmax, ymax (large image)
+            x1b, y1b, x2b, y2b = w - (x2a - x1a), h - (y2a - y1a), w, h  # xmin, ymin, xmax, ymax (small image)
+        elif i == 1:  # top right
+            x1a, y1a, x2a, y2a = xc, max(yc - h, 0), min(xc + w, s * 2), yc
+            x1b, y1b, x2b, y2b = 0, h - (y2a - y1a), min(w, x2a - x1a), h
+        elif i == 2:  # bottom left
+            x1a, y1a, x2a, y2a = max(xc - w, 0), yc, xc, min(s * 2, yc + h)
+            x1b, y1b, x2b, y2b = w - (x2a - x1a), 0, w, min(y2a - y1a, h)
+        else:  # bottom right
+            x1a, y1a, x2a, y2a = xc, yc, min(xc + w, s * 2), min(s * 2, yc + h)
+            x1b, y1b, x2b, y2b = 0, 0, min(w, x2a - x1a), min(y2a - y1a, h)
+        return (x1a, y1a, x2a, y2a), (x1b, y1b, x2b, y2b)
+
     def _mosaic9(self, labels):
         """Create a 3x3 image mosaic."""
         mosaic_labels = []
@@ -261,6 +270,118 @@ class Mosaic(BaseMixTransform):
         return final_labels
 
 
+class EventMosaic(Mosaic):
+    """
+    2x2 mosaic of event histograms assembled in a canvas reused across samples.
+
+    Tiles are written into a (2 * imgsz, 2 * imgsz, C) canvas that is allocated once per DataLoader worker with the
+    zero fill of an empty histogram, and only the regions written by the previous mosaic are cleared. The other three
+    tiles are drawn where reading them is free: any frame if the frames are cached in RAM or on disk, else the frames
+    of the slab holding the current sample if `slab_size > 0`, else the last `resident_size` samples of this transform,
+    kept in memory. Only the first mosaics of a worker, before 3 samples are resident, read their tiles again from HDF5.
+    Boxes of all tiles are denormalized and offset in a single vectorized pass.
+
+    The returned image is a view of the canvas, valid until the next mosaic is built, so a copying transform such as
+    `RandomPerspective` must follow. With `crop=True` the imgsz x imgsz center of the canvas is returned as a copy
+    instead, i.e. what `RandomPerspective` returns with an identity warp, for `batch_augment` where the warp is applied
+    later to the whole batch. The later warp only sees the crop, so zoom-outs and translations fill with the empty
+    histogram border of `BatchRandomPerspective(border_value=0)` where `RandomPerspective` shows the neighbouring tiles.
+
+    Attributes:
+        dataset: The event dataset on which the mosaic augmentation is applied.
+        imgsz (int, optional): Image size (height and width) after mosaic pipeline of a single image. Default to 640.
+        p (float, optional): Probability of applying the mosaic augmentation. Must be in the range 0-1. Default to 1.0.
+        crop (bool, optional): Return the imgsz x imgsz center of the mosaic. Default to False.
+        resident_size (int, optional): Number of samples kept as tiles without cache or slab. Default to 32.
+        canvas (np.ndarray | None): Reused mosaic image, allocated on first use.
+        resident (deque): Labels of the last samples, tiles of the mosaic without cache or slab.
+    """
+
+    def __init__(self, dataset, imgsz=640, p=1.0, crop=False, resident_size=32):
+        """Initializes the object with a dataset, image size and probability and groups frames by slab."""
+        super().__init__(dataset, imgsz=imgsz, p=p, n=4)
+        self.crop = crop
+        self.resident = deque(maxlen=resident_size)
+        self.canvas = None
+        self.dirty = []  # canvas regions written by the last mosaic
+        self.slabs = {}  # (file_idx, slab index) -> dataset indices
+        if dataset.slab_size:
+            for i, (file_idx, frame_idx) in enumerate(lb['im_file'] for lb in dataset.labels):
+                self.slabs.setdefault((file_idx, frame_idx // dataset.slab_size), []).append(i)
+
+    def __call__(self, labels):
+        """Applies the mosaic, with tiles drawn from `resident` if frames are neither cached nor read by slab."""
+        if self.dataset.arena is not None or self.dataset.slab_size:
+            return super().__call__(labels)
+        if random.uniform(0, 1) > self.p:
+            return labels
+        if len(self.resident) >= self.n - 1:
+            mix_labels = [x.copy() for x in random.choices(self.resident, k=self.n - 1)]  # shallow, tiles are read only
+        else:  # first mosaics, read again
+            mix_labels = [self.dataset.get_image_and_label(i) for i in self.get_indexes()]
+        self.resident.append(labels.copy())
+        labels['mix_labels'] = mix_labels
+        return self._mix_transform(labels)
+
+    def get_indexes(self):
+        """
+        Return 3 indexes of frames that are read without touching HDF5 if frames are cached or read by slab.
+
+        Otherwise 3 indexes of `dataset.buffer` are returned, whose frames are read again, see `__call__`.
+        """
+        if self.dataset.arena is not None:  # cached frames, every tile is a view of the cache
+            return super().get_indexes(buffer=False)
+        slab = self.dataset.slab  # (file_idx, first frame index, frames) read for the current sample
+        if slab is not None:
+            return random.choices(self.slabs[slab[0], (slab[1] + len(slab[2]) - 1) // self.dataset.slab_size], k=3)
+        return super().get_indexes()
+
+    def _mosaic4(self, labels):
+        """Create a 2x2 mosaic in the reused canvas."""
+        s = self.imgsz
+        yc, xc = (int(random.uniform(-x, 2 * s + x)) for x in self.border)  # mosaic center x, y
+        patches = [labels, *labels['mix_labels']]
+        img = labels['img']
+        if self.canvas is None or self.canvas.shape[2] != img.shape[2] or self.canvas.dtype != img.dtype:
+            self.canvas, self.dirty = np.zeros((s * 2, s * 2, img.shape[2]), dtype=img.dtype), []
+        for x1, y1, x2, y2 in self.dirty:
+            self.canvas[y1:y2, x1:x2] = 0
+        self.dirty, scale, pad = [], [], []
+        for i, patch in enumerate(patches):
+            img = patch['img']
+            h, w = patch.pop('resized_shape')
+            (x1a, y1a, x2a, y2a), (x1b, y1b, x2b, y2b) = self._tile4(i, xc, yc, w, h, s)
+            self.canvas[y1a:y2a, x1a:x2a] = img[y1b:y2b, x1b:x2b]
+            self.dirty.append((x1a, y1a, x2a, y2a))
+            nh, nw = img.shape[:2]
+            scale.append((nw, nh) if patch['instances'].normalized else (1, 1))
+            pad.append((x1a - x1b, y1a - y1b))
+
+        # Labels, all tiles at once
+        n = [len(patch['cls']) for patch in patches]
+        instances = Instances(np.concatenate([patch['instances'].bboxes for patch in patches], 0),
+                              bbox_format=labels['instances']._bboxes.format)
+        instances.convert_bbox(format='xyxy')
+        scale, pad = (np.repeat(np.array(x, dtype=np.float32), n, 0) for x in (scale, pad))
+        size, offset = (s, s // 2) if self.crop else (s * 2, 0)  # output size, offset of the output in the canvas
+        bboxes = instances.bboxes * np.tile(scale, 2) + np.tile(pad, 2) - offset
+        final_labels = {
+            'im_file': labels['im_file'],
+            'ori_shape': labels['ori_shape'],
+            'resized_shape': (size, size),
+            'cls': np.concatenate([patch['cls'] for patch in patches], 0),
+            'instances': Instances(bboxes, bbox_format='xyxy', normalized=False)}
+        final_labels['instances'].clip(size, size)
+        good = final_labels['instances'].remove_zero_area_boxes()
+        final_labels['cls'] = final_labels['cls'][good]
+        if self.crop:  # no warp follows, copied out of the canvas
+            final_labels['img'] = self.canvas[offset:offset + size, offset:offset + size].copy()
+            final_labels['ratio_pad'] = (1.0, 1.0)  # not resized, collated with samples letterboxed without mosaic
+        else:
+            final_labels['img'], final_labels['mosaic_border'] = self.canvas, self.border
+        return final_labels
+
+
 class MixUp(BaseMixTransform):
 
     def __init__(self, dataset, pre_transform=None, p=0.0) -> None:
@@ -299,12 +420,24 @@ class RandomPerspective:
         self.border = border
         self.pre_transform = pre_transform
 
-    def affine_transform(self, img, border):
-        """Center."""
+    def affine_transform(self, img, border, pre=None, shape=None):
+        """
+        Center, perspective, rotate and scale, shear and translate `img` in a single warp.
+
+        Args:
+            img (ndarray): Image to warp.
+            border (tuple): Mosaic border.
+            pre (ndarray, optional): (3, 3) matrix applied first, e.g. `LetterBox.get_matrix()`, so that the image is
+                resampled once instead of twice.
+            shape (tuple, optional): Image shape (h, w) after `pre`. Defaults to `img.shape[:2]`.
+        """
+        h, w = shape or img.shape[:2]
         C = np.eye(3, dtype=np.float32)
 
-        C[0, 2] = -img.shape[1] / 2  # x translation (pixels)
-        C[1, 2] = -img.shape[0] / 2  # y translation (pixels)
+        C[0, 2] = -w / 2  # x translation (pixels)
+        C[1, 2] = -h / 2  # y translation (pixels)
+        if pre is not None:
+            C = C @ pre
 
         # Perspective
         P = np.eye(3, dtype=np.float32)
@@ -331,12 +464,12 @@ class RandomPerspective:
 
         # Combined rotation matrix
         M = T @ S @ R @ P @ C  # order of operations (right to left) is IMPORTANT
-        # Affine image
+        # Affine image, a 4-value border fills every channel of images with more than 4 channels
         if (border[0] != 0) or (border[1] != 0) or (M != np.eye(3)).any():  # image changed
             if self.perspective:
-                img = cv2.warpPerspective(img, M, dsize=self.size, borderValue=(114, 114, 114))
+                img = cv2.warpPerspective(img, M, dsize=self.size, borderValue=(114, 114, 114, 114))
             else:  # affine
-                img = cv2.warpAffine(img, M[:2], dsize=self.size, borderValue=(114, 114, 114))
+                img = cv2.warpAffine(img, M[:2], dsize=self.size, borderValue=(114, 114, 114, 114))
         return img, M, s
 
     def apply_bboxes(self, bboxes, M):
@@ -419,8 +552,12 @@ class RandomPerspective:
         Args:
             labels (dict): a dict of `bboxes`, `segments`, `keypoints`.
         """
+        L, ratio = None, (1.0, 1.0)
         if self.pre_transform and 'mosaic_border' not in labels:
-            labels = self.pre_transform(labels)
+            if isinstance(self.pre_transform, LetterBox):  # fused into the affine matrix
+                L, (w, h), ratio = self.pre_transform.get_matrix(labels)
+            else:
+                labels = self.pre_transform(labels)
         labels.pop('ratio_pad', None)  # do not need ratio pad
 
         img = labels['img']
@@ -429,12 +566,14 @@ class RandomPerspective:
         # Make sure the coord formats are right
         instances.convert_bbox(format='xyxy')
         instances.denormalize(*img.shape[:2][::-1])
+        if L is None:
+            h, w = img.shape[:2]
 
         border = labels.pop('mosaic_border', self.border)
-        self.size = img.shape[1] + border[1] * 2, img.shape[0] + border[0] * 2  # w, h
+        self.size = w + border[1] * 2, h + border[0] * 2  # w, h
         # M is affine matrix
         # scale for func:`box_candidates`
-        img, M, scale = self.affine_transform(img, border)
+        img, M, scale = self.affine_transform(img, border, pre=L, shape=(h, w))
 
         bboxes = self.apply_bboxes(instances.bboxes, M)
 
@@ -451,7 +590,7 @@ class RandomPerspective:
         new_instances.clip(*self.size)
 
         # Filter instances
-        instances.scale(scale_w=scale, scale_h=scale, bbox_only=True)
+        instances.scale(scale_w=scale * ratio[0], scale_h=scale * ratio[1], bbox_only=True)
         # Make the bboxes have the same scale with new_bboxes
         i = self.box_candidates(box1=instances.bboxes.T,
                                 box2=new_instances.bboxes.T,
@@ -470,6 +609,118 @@ class RandomPerspective:
         return (w2 > wh_thr) & (h2 > wh_thr) & (w2 * h2 / (w1 * h1 + eps) > area_thr) & (ar < ar_thr)  # candidates
 
 
+class BatchRandomPerspective:
+    """
+    RandomPerspective and both RandomFlips of `v8_transforms` applied to a whole collated detection batch.
+
+    One (3, 3) matrix per image is sampled from the same distributions as the per-image transforms, with the flips
+    composed into it. All images are warped by a single `grid_sample` with cv2.warpAffine pixel conventions and all
+    boxes by a single batched matmul, followed by the same clipping and `box_candidates` filtering. Works on any device.
+
+    Attributes:
+        degrees (float): Rotation range (+/- deg).
+        translate (float): Translation range (+/- fraction).
+        scale (float): Scale range (+/- gain).
+        shear (float): Shear range (+/- deg).
+        perspective (float): Perspective range (+/- fraction).
+        flipud (float): Probability of an up-down flip.
+        fliplr (float): Probability of a left-right flip.
+        border_value (float): Fill value of pixels warped from outside the image, 114 of normalized uint8 images, 0 for
+            the empty histograms of cropped `EventMosaic` images.
+    """
+
+    def __init__(self,
+                 degrees=0.0,
+                 translate=0.1,
+                 scale=0.5,
+                 shear=0.0,
+                 perspective=0.0,
+                 flipud=0.0,
+                 fliplr=0.5,
+                 border_value=114 / 255):
+        self.degrees = degrees
+        self.translate = translate
+        self.scale = scale
+        self.shear = shear
+        self.perspective = perspective
+        self.flipud = flipud
+        self.fliplr = fliplr
+        self.border_value = border_value
+
+    def get_matrices(self, n, h, w):
+        """Return (n, 3, 3) float32 matrices mapping source to destination pixels, and (n, ) scale gains."""
+
+        def uniform(a, b):
+            return torch.rand(n) * (b - a) + a
+
+        C = torch.eye(3).repeat(n, 1, 1)  # center
+        C[:, 0, 2], C[:, 1, 2] = -w / 2, -h / 2
+        P = torch.eye(3).repeat(n, 1, 1)  # perspective
+        P[:, 2, 0] = uniform(-self.perspective, self.perspective)  # x perspective (about y)
+        P[:, 2, 1] = uniform(-self.perspective, self.perspective)  # y perspective (about x)
+        R = torch.eye(3).repeat(n, 1, 1)  # rotation and scale, as cv2.getRotationMatrix2D()
+        a, s = uniform(-self.degrees, self.degrees) * math.pi / 180, uniform(1 - self.scale, 1 + self.scale)
+        R[:, 0, 0], R[:, 0, 1], R[:, 1, 0], R[:, 1, 1] = s * a.cos(), s * a.sin(), -s * a.sin(), s * a.cos()
+        S = torch.eye(3).repeat(n, 1, 1)  # shear
+        S[:, 0, 1] = (uniform(-self.shear, self.shear) * math.pi / 180).tan()
+        S[:, 1, 0] = (uniform(-self.shear, self.shear) * math.pi / 180).tan()
+        T = torch.eye(3).repeat(n, 1, 1)  # translation
+        T[:, 0, 2] = uniform(0.5 - self.translate, 0.5 + self.translate) * w
+        T[:, 1, 2] = uniform(0.5 - self.translate, 0.5 + self.translate) * h
+        F = torch.eye(3).repeat(n, 1, 1)  # flips
+        ud, lr = torch.rand(n) < self.flipud, torch.rand(n) < self.fliplr
+        F[ud, 1, 1], F[ud, 1, 2] = -1, h
+        F[lr, 0, 0], F[lr, 0, 2] = -1, w
+        return F @ T @ S @ R @ P @ C, s  # order of operations (right to left) is IMPORTANT
+
+    def __call__(self, batch):
+        """
+        Augment a collated batch in place.
+
+        Args:
+            batch (dict): 'img' (B, C, H, W) float images and 'bboxes' normalized xywh, 'cls' and 'batch_idx' targets.
+
+        Returns:
+            (dict): The batch with warped images and the transformed, filtered targets.
+        """
+        img = batch['img']
+        b, _, h, w = img.shape
+        M, s = self.get_matrices(b, h, w)
+        M, s = M.to(img.device), s.to(img.device)
+
+        # Images, destination pixel (x, y) samples the source at M^-1 (x, y, 1) like cv2.warpAffine()
+        y, x = torch.meshgrid(torch.arange(h, device=img.device), torch.arange(w, device=img.device), indexing='ij')
+        xy = torch.stack((x, y, torch.ones_like(x)), -1).view(1, -1, 3).float() @ torch.linalg.inv(M).transpose(1, 2)
+        xy = xy[..., :2] / xy[..., 2:] / torch.tensor((w - 1, h - 1), device=img.device) * 2 - 1  # to [-1, 1]
+        v = self.border_value  # grid_sample() pads with zeros
+        img = torch.nn.functional.grid_sample(img - v, xy.view(b, h, w, 2).to(img.dtype), align_corners=True)
+        batch['img'] = img + v
+
+        # Boxes, the 4 corners of every box warped by the matrix of its image
+        bboxes, idx = batch['bboxes'], batch['batch_idx'].long()
+        if len(bboxes):
+            gain = torch.tensor((w, h, w, h), device=bboxes.device, dtype=bboxes.dtype)
+            boxes = xywh2xyxy(bboxes) * gain
+            corners = boxes[:, [0, 1, 2, 3, 0, 3, 2, 1]].view(-1, 4, 2)  # x1y1, x2y2, x1y2, x2y1
+            corners = torch.cat((corners, torch.ones_like(corners[..., :1])), -1) @ M[idx].transpose(1, 2).to(boxes)
+            corners = corners[..., :2] / corners[..., 2:]  # perspective rescale or affine
+            new = torch.cat((corners.min(1).values, corners.max(1).values), 1)
+            new[:, [0, 2]] = new[:, [0, 2]].clamp(0, w)
+            new[:, [1, 3]] = new[:, [1, 3]].clamp(0, h)
+            i = self.box_candidates(box1=(boxes * s[idx, None]).T, box2=new.T)
+            batch['bboxes'] = xyxy2xywh(new[i]) / gain
+            batch['cls'], batch['batch_idx'] = batch['cls'][i], batch['batch_idx'][i]
+        return batch
+
+    @staticmethod
+    def box_candidates(box1, box2, wh_thr=2, ar_thr=100, area_thr=0.1, eps=1e-16):  # box1(4,n), box2(4,n)
+        """Torch version of RandomPerspective.box_candidates()."""
+        w1, h1 = box1[2] - box1[0], box1[3] - box1[1]
+        w2, h2 = box2[2] - box2[0], box2[3] - box2[1]
+        ar = torch.maximum(w2 / (h2 + eps), h2 / (w2 + eps))  # aspect ratio
+        return (w2 > wh_thr) & (h2 > wh_thr) & (w2 * h2 / (w1 * h1 + eps) > area_thr) & (ar < ar_thr)  # candidates
+
+
 class RandomHSV:
 
     def __init__(self, hgain=0.5, sgain=0.5, vgain=0.5) -> None:
@@ -549,6 +800,37 @@ class LetterBox:
         img = labels.get('img') if image is None else image
         shape = img.shape[:2]  # current shape [height, width]
         new_shape = labels.pop('rect_shape', self.new_shape)
+        ratio, new_unpad, (dw, dh), (top, bottom, left, right) = self.get_params(shape, new_shape)
+
+        if shape[::-1] != new_unpad:  # resize
+            img = cv2.resize(img, new_unpad, interpolation=cv2.INTER_LINEAR)
+        img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                                 value=(114, 114, 114, 114))  # add border, all channels of stacked histograms
+        if labels.get('ratio_pad'):
+            labels['ratio_pad'] = (labels['ratio_pad'], (left, top))  # for evaluation
+
+        if len(labels):
+            labels = self._update_labels(labels, ratio, dw, dh)
+            labels['img'] = img
+            labels['resized_shape'] = new_shape
+            return labels
+        else:
+            return img
+
+    def get_params(self, shape, new_shape):
+        """
+        Compute the letterbox geometry of an image.
+
+        Args:
+            shape (tuple): Image shape (h, w).
+            new_shape (int | tuple): Target shape (h, w).
+
+        Returns:
+            ratio (tuple): Width and height scale ratios.
+            new_unpad (tuple): Resized image size (w, h) before padding.
+            pad (tuple): Label padding (dw, dh).
+            border (tuple): Image border in pixels (top, bottom, left, right).
+        """
         if isinstance(new_shape, int):
             new_shape = (new_shape, new_shape)
 
@@ -571,23 +853,26 @@ class LetterBox:
         if self.center:
             dw /= 2  # divide padding into 2 sides
             dh /= 2
-
-        if shape[::-1] != new_unpad:  # resize
-            img = cv2.resize(img, new_unpad, interpolation=cv2.INTER_LINEAR)
         top, bottom = int(round(dh - 0.1)) if self.center else 0, int(round(dh + 0.1))
         left, right = int(round(dw - 0.1)) if self.center else 0, int(round(dw + 0.1))
-        img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT,
-                                 value=(114, 114, 114))  # add border
-        if labels.get('ratio_pad'):
-            labels['ratio_pad'] = (labels['ratio_pad'], (left, top))  # for evaluation
+        return ratio, new_unpad, (dw, dh), (top, bottom, left, right)
 
-        if len(labels):
-            labels = self._update_labels(labels, ratio, dw, dh)
-            labels['img'] = img
-            labels['resized_shape'] = new_shape
-            return labels
-        else:
-            return img
+    def get_matrix(self, labels):
+        """
+        Return the letterbox of `labels['img']` as an affine matrix for fusing into a later warp, see RandomPerspective.
+
+        Returns:
+            L (ndarray): (3, 3) matrix mapping image pixels to letterboxed pixels.
+            size (tuple): Letterboxed image size (w, h).
+            ratio (tuple): Width and height scale ratios.
+        """
+        shape = labels['img'].shape[:2]
+        new_shape = labels.pop('rect_shape', self.new_shape)
+        ratio, new_unpad, _, (top, bottom, left, right) = self.get_params(shape, new_shape)
+        L = np.eye(3, dtype=np.float32)
+        L[0, 0], L[1, 1] = new_unpad[0] / shape[1], new_unpad[1] / shape[0]  # scale of the rounded resize
+        L[:2, 2] = left, top  # padding
+        return L, (new_unpad[0] + left + right, new_unpad[1] + top + bottom), ratio
 
     def _update_labels(self, labels, ratio, padw, padh):
         """Update labels."""
@@ -698,7 +983,8 @@ class Format:
                  return_keypoint=False,
                  mask_ratio=4,
                  mask_overlap=True,
-                 batch_idx=True):
+                 batch_idx=True,
+                 packbits=False):
         self.bbox_format = bbox_format
         self.normalize = normalize
         self.return_mask = return_mask  # set False when training detection only
@@ -706,6 +992,7 @@ class Format:
         self.mask_ratio = mask_ratio
         self.mask_overlap = mask_overlap
         self.batch_idx = batch_idx  # keep the batch indexes
+        self.packbits = packbits  # binarize and bit-pack the image along W, see ops.unpackbits()
 
     def __call__(self, labels):
         """Return formatted image, classes, bounding boxes & keypoints to be used by 'collate_fn'."""
@@ -728,8 +1015,9 @@ class Format:
         if self.normalize:
             instances.normalize(w, h)
         labels['img'] = self._format_img(img)
+        cls, bboxes = np.require(cls, requirements='W'), np.require(instances.bboxes, requirements='W')  # own read-only
         labels['cls'] = torch.from_numpy(cls) if nl else torch.zeros(nl)
-        labels['bboxes'] = torch.from_numpy(instances.bboxes) if nl else torch.zeros((nl, 4))
+        labels['bboxes'] = torch.from_numpy(bboxes) if nl else torch.zeros((nl, 4))
         if self.return_keypoint:
             labels['keypoints'] = torch.from_numpy(instances.keypoints)
         # Then we can use collate_fn
@@ -738,10 +1026,20 @@ class Format:
         return labels
 
     def _format_img(self, img):
-        """Format the image for YOLOv5 from Numpy array to PyTorch tensor."""
+        """
+        Format the image for YOLOv5 from Numpy array to PyTorch tensor.
+
+        3-channel images are flipped from BGR to RGB and copied contiguous. Other layouts such as (positive, negative)
+        event histograms keep their channel order and are returned as a CHW view without a copy, `collate_fn` stacking
+        the batch is then their only copy.
+        """
         if len(img.shape) < 3:
             img = np.expand_dims(img, -1)
-        img = np.ascontiguousarray(img.transpose(2, 0, 1)[::-1])
+        img = img.transpose(2, 0, 1)
+        if img.shape[0] == 3:
+            img = np.ascontiguousarray(img[::-1])
+        if self.packbits:  # (C, H, W) any events to (C, H, W / 8) bits, W is a multiple of the model stride
+            img = np.packbits(img > 0, axis=-1)
         img = torch.from_numpy(img)
         return img
 
@@ -761,8 +1059,12 @@ class Format:
 
 def v8_transforms(dataset, imgsz, hyp, stretch=False):
     """Convert images to a size suitable for YOLOv8 training."""
+    if hyp.batch_augment and not (dataset.use_segments or dataset.use_keypoints):  # see BatchRandomPerspective
+        mosaic = EventMosaic(dataset, imgsz=imgsz, p=hyp.mosaic, crop=True)  # warped with the batch
+        return Compose([mosaic] if stretch else [mosaic, LetterBox(new_shape=(imgsz, imgsz))])
+    mosaic = Mosaic if dataset.use_segments or dataset.use_keypoints else EventMosaic
     pre_transform = Compose([
-        # Mosaic(dataset, imgsz=imgsz, p=hyp.mosaic),
+        mosaic(dataset, imgsz=imgsz, p=hyp.mosaic),
         # CopyPaste(p=hyp.copy_paste),
         RandomPerspective(
             degrees=hyp.degrees,
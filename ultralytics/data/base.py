@@ -1,23 +1,21 @@
 # Ultralytics YOLO 🚀, AGPL-3.0 license
 
 import glob
+import hashlib
 import math
 import os
-import random
-from copy import deepcopy
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
 from typing import Optional
 
 import cv2
-import h5py
 import numpy as np
 import psutil
 from torch.utils.data import Dataset
 
 from ultralytics.utils import DEFAULT_CFG, LOCAL_RANK, LOGGER, NUM_THREADS, TQDM
 
-from .utils import HELP_URL, IMG_FORMATS
+from .utils import HELP_URL, IMG_FORMATS, H5FilePool, SharedArena, events_frames, get_hash, readonly
 
 
 class BaseDataset(Dataset):
@@ -44,10 +42,21 @@ class BaseDataset(Dataset):
         labels (list): List of label data dictionaries.
         ni (int): Number of images in the dataset.
         ims (list): List of loaded images.
-        npy_files (list): List of numpy file paths.
+        arena (SharedArena | np.ndarray | None): Flat uint8 buffer of all cached frames, shared RAM or memory-mapped.
+        arena_offsets (np.ndarray | None): Byte offset of every cached frame in `arena`, length ni + 1.
+        h5_pool (H5FilePool | EventStore): Per-worker pool of open *.h5 file handles, or the converted store.
+        store (EventStore | None): Memory-mapped store if `img_path` was converted by `convert_events_to_store()`.
+        slab_size (int): Number of consecutive frames read at once by `read_frame()`, 0 to read single frames.
+        temporal_stack (int): Number of consecutive histograms stacked along channels by `read_frame()`.
+        histograms (dict): `events_frames()` settings of recordings with raw events instead of histograms.
         transforms (callable): Image transformation function.
     """
 
+    slab_size = 0  # frames per contiguous *.h5 read, overridden by event datasets
+    temporal_stack = 1  # histograms per sample, overridden by event datasets
+    store = None  # EventStore of a converted split, replaces the *.h5 files
+    histograms = {}  # histogram settings of raw event recordings, overridden by event datasets
+
     def __init__(self,
                  img_path,
                  imgsz=640,
@@ -70,6 +79,8 @@ class BaseDataset(Dataset):
         self.prefix = prefix
         self.fraction = fraction
         self.im_files = self.get_img_files(self.img_path)
+        self.h5_pool = self.store or H5FilePool()
+        self.slab = None  # (file_idx, first frame index, frames) of the last slab read
         self.labels = self.get_events_labels()
         self.update_labels(include_class=classes)  # single_cls and include_class
         self.ni = len(self.labels)  # number of images
@@ -86,12 +97,13 @@ class BaseDataset(Dataset):
         self.max_buffer_length = min((self.ni, self.batch_size * 8, 1000)) if self.augment else 0
 
         # Cache stuff
-        if cache == 'ram' and not self.check_cache_ram():
-            cache = False
         self.ims, self.im_hw0, self.im_hw = [None] * self.ni, [None] * self.ni, [None] * self.ni
-        # self.npy_files = [Path(f).with_suffix('.npy') for f in self.im_files]
+        self.arena, self.arena_offsets = None, None  # cached frames, flat uint8 buffer and per-index byte offsets
+        shapes = self.frame_shapes() if cache else None  # read once for the RAM check and the arena
+        if cache == 'ram' and not self.check_cache_ram(shapes=shapes):
+            cache = False
         if cache:
-            self.cache_images(cache)
+            self.cache_images(cache, shapes)
 
         # Transforms
         self.transforms = self.build_transforms(hyp=hyp)
@@ -139,22 +151,18 @@ class BaseDataset(Dataset):
                 if keypoints is not None:
                     self.labels[i]['keypoints'] = keypoints[j]
             if self.single_cls:
-                self.labels[i]['cls'][:, 0] = 0
+                self.labels[i]['cls'] = np.zeros_like(self.labels[i]['cls'])  # views into the label index are shared
 
     def load_image(self, i, rect_mode=True):
-        # """Loads 1 image from dataset index 'i', returns (im, resized hw)."""
-        # im, f, fn = self.ims[i], self.im_files[i], self.npy_files[i]
-        # if im is None:  # not cached in RAM
-        #     if fn.exists():  # load npy
-        #         im = np.load(fn)
-        #     else:  # read image
-        #         im = cv2.imread(f)  # BGR
-        #         if im is None:
-        #             raise FileNotFoundError(f'Image Not Found {f}')
-        file_idx, frame_idx = self.labels[i]["im_file"]
-        ev_frame_identifier = self.im_files[file_idx] + "_frame_" + str(frame_idx)
-        with h5py.File(self.im_files[file_idx], "r") as h5_file:
-            im = h5_file["data"][frame_idx * 2].transpose(1, 2, 0)
+        """Loads 1 event frame from dataset index 'i', returns (im, original hw, resized hw, frame identifier)."""
+        file_idx, frame_idx = self.labels[i]['im_file']
+        ev_frame_identifier = self.im_files[file_idx] + '_frame_' + str(frame_idx)
+        if self.arena is not None and rect_mode:  # cached in RAM or on disk, HDF5 is not touched
+            (h, w), c = self.im_hw[i], self.arena_channels
+            im = self.arena[self.arena_offsets[i]:self.arena_offsets[i + 1]].reshape(h, w, c)
+            return im, self.im_hw0[i], (h, w), ev_frame_identifier
+
+        im = self.read_frame(file_idx, frame_idx).transpose(1, 2, 0)
         h0, w0 = im.shape[:2]  # orig hw
         if rect_mode:  # resize long side to imgsz while maintaining aspect ratio
             r = self.imgsz / max(h0, w0)  # ratio
@@ -164,48 +172,135 @@ class BaseDataset(Dataset):
         elif not (h0 == w0 == self.imgsz):  # resize by stretching image to square imgsz
             im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
 
-        # Add to buffer if training with augmentations
+        # Add to buffer if training with augmentations, frames are read again when used as mosaic tiles
         if self.augment:
-            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]  # im, hw_original, hw_resized
+            self.im_hw0[i], self.im_hw[i] = (h0, w0), im.shape[:2]  # hw_original, hw_resized
             self.buffer.append(i)
             if len(self.buffer) >= self.max_buffer_length:
                 j = self.buffer.pop(0)
-                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+                self.im_hw0[j], self.im_hw[j] = None, None
 
         return im, (h0, w0), im.shape[:2], ev_frame_identifier
 
-        # return self.ims[i], self.im_hw0[i], self.im_hw[i]
-    def cache_images(self, cache):
-        """Cache images to memory or disk."""
-        b, gb = 0, 1 << 30  # bytes of cached images, bytes per gigabytes
-        fcn = self.cache_images_to_disk if cache == 'disk' else self.load_image
+    def read_frame(self, file_idx, frame_idx):
+        """Read event histogram `frame_idx` (C, H, W) of recording `file_idx`.
+
+        With `slab_size > 0` the aligned block of `slab_size` frames around `frame_idx` is read with a single slice and
+        following frames of the same block are served from memory, which pairs with `ChunkLocalitySampler`.
+        With `temporal_stack=T > 1` the T histograms ending at `frame_idx` are read as one slice and stacked oldest
+        first as (T * C, H, W), zero-padded before the start of the recording.
+        """
+        data = self.frames(file_idx)
+        first = max(frame_idx - self.temporal_stack + 1, 0)
+        if not self.slab_size:
+            x = data[first:frame_idx + 1]
+        else:
+            slab = self.slab  # single read, ThreadPool safe
+            if slab is None or slab[0] != file_idx or not (slab[1] <= first and frame_idx < slab[1] + len(slab[2])):
+                start = frame_idx // self.slab_size * self.slab_size
+                start0 = max(start - self.temporal_stack + 1, 0)  # with the history of the first frame of the slab
+                slab = self.slab = file_idx, start0, data[start0:start + self.slab_size]
+            x = slab[2][first - slab[1]:frame_idx + 1 - slab[1]]
+        if self.temporal_stack == 1:
+            return x[0]
+        if len(x) < self.temporal_stack:
+            x = np.concatenate((np.zeros((self.temporal_stack - len(x), *x.shape[1:]), dtype=x.dtype), x))
+        return x.reshape(-1, *x.shape[2:])
+
+    def frames(self, file_idx):
+        """Return the (N, C, H, W) frames of recording `file_idx`, read from *.h5 'data' or built from raw events."""
+        return events_frames(self.h5_pool.get(self.im_files[file_idx]), **self.histograms)
+
+    def frame_shapes(self):
+        """Return (N, 2) original and (N, 2) resized hw of every label and the channel count, from *.h5 shapes."""
+        files = np.array([lb['im_file'][0] for lb in self.labels], dtype=np.int64)
+        shapes = np.array([self.frames(i).shape for i in range(len(self.im_files))], dtype=np.int64)  # (n, c, h, w)
+        hw0 = shapes[files, 2:]
+        r = self.imgsz / hw0.max(1, keepdims=True)  # resize long side to imgsz, as load_image(rect_mode=True)
+        hw = np.where(r != 1, np.minimum(np.ceil(hw0 * r), self.imgsz), hw0).astype(np.int64)
+        return hw0, hw, int(shapes[:, 1].max()) * self.temporal_stack if len(shapes) else 0
+
+    def cache_images(self, cache, shapes=None):
+        """
+        Cache resized event frames into one preallocated uint8 arena.
+
+        'ram' places the arena in shared memory, so DataLoader workers and DDP ranks on a node attach to a single copy
+        filled by the first process, 'disk' writes a single memory-mapped *.npy per split. `shapes` are the results of
+        `frame_shapes()` if already computed.
+        """
+        hw0, hw, c = self.frame_shapes() if shapes is None else shapes
+        self.arena_channels = c
+        self.arena_offsets = np.concatenate(([0], np.cumsum(hw.prod(1) * c)))
+        self.im_hw0, self.im_hw = [tuple(x) for x in hw0.tolist()], [tuple(x) for x in hw.tolist()]
+        nbytes, gb = int(self.arena_offsets[-1]), 1 << 30  # bytes of cached frames, bytes per gigabytes
+        if cache == 'disk':
+            f = self.cache_file()
+            if f.exists():
+                self.arena = np.load(f, mmap_mode='r')
+                if self.arena.shape == (nbytes, ):
+                    LOGGER.info(f'{self.prefix}Using cached frames {f} ({nbytes / gb:.1f}GB disk)')
+                    return
+            tmp = f.with_name(f'{f.name}.tmp')
+            try:
+                arena = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=(nbytes, ))
+            except OSError as e:
+                LOGGER.warning(f'{self.prefix}WARNING ⚠️ Cache directory {f.parent} is not writeable, '
+                               f'not caching images to disk: {e}')
+                self.arena, self.arena_offsets = None, None
+                return
+        else:  # 'ram', one copy per node in shared memory, attached by DataLoader workers and DDP ranks
+            try:
+                arena = SharedArena(f'yolo_{self.cache_key()[:16]}', nbytes)
+            except OSError as e:
+                LOGGER.warning(f'{self.prefix}WARNING ⚠️ Shared memory unavailable, caching images per process: {e}')
+                arena = np.empty(nbytes, dtype=np.uint8)
+            else:
+                if arena.ready:  # filled by another rank or process
+                    LOGGER.info(f'{self.prefix}Using shared cached frames {arena.name} ({nbytes / gb:.1f}GB ram)')
+                    self.arena = arena
+                    return
+
+        def fill(i):
+            """Write the resized frame of index 'i' into its arena slot."""
+            file_idx, frame_idx = self.labels[i]['im_file']
+            im = self.read_frame(file_idx, frame_idx).transpose(1, 2, 0)
+            if im.shape[:2] != self.im_hw[i]:
+                im = cv2.resize(im, self.im_hw[i][::-1], interpolation=cv2.INTER_LINEAR)
+            arena[self.arena_offsets[i]:self.arena_offsets[i + 1]] = im.reshape(-1)
+            return im.nbytes
+
+        b = 0
         with ThreadPool(NUM_THREADS) as pool:
-            results = pool.imap(fcn, range(self.ni))
-            pbar = TQDM(enumerate(results), total=self.ni, disable=LOCAL_RANK > 0)
-            for i, x in pbar:
-                if cache == 'disk':
-                    b += self.npy_files[i].stat().st_size
-                else:  # 'ram'
-                    self.ims[i], self.im_hw0[i], self.im_hw[i] = x  # im, hw_orig, hw_resized = load_image(self, i)
-                    b += self.ims[i].nbytes
+            pbar = TQDM(pool.imap(fill, range(self.ni)), total=self.ni, disable=LOCAL_RANK > 0)
+            for x in pbar:
+                b += x
                 pbar.desc = f'{self.prefix}Caching images ({b / gb:.1f}GB {cache})'
             pbar.close()
+        if cache == 'disk':
+            arena.flush()
+            del arena
+            os.replace(tmp, f)  # atomic, a partially written cache is never picked up
+            arena = np.load(f, mmap_mode='r')
+        elif isinstance(arena, SharedArena):
+            arena.set_ready()
+        self.arena = arena
+
+    def cache_key(self):
+        """Return a hash of the cached frames, keyed on recordings, frame selection and order, imgsz and histograms."""
+        h = hashlib.sha256((get_hash(self.im_files) + str(self.imgsz) + str(self.histograms) +
+                            str(self.temporal_stack)).encode())
+        h.update(np.array([lb['im_file'] for lb in self.labels], dtype=np.int64).tobytes())
+        return h.hexdigest()
+
+    def cache_file(self):
+        """Return the per-split *.npy path of the disk frame cache."""
+        return Path(self.im_files[0]).parent.with_suffix(f'.{self.cache_key()[:16]}.npy')
 
-    def cache_images_to_disk(self, i):
-        """Saves an image as an *.npy file for faster loading."""
-        f = self.npy_files[i]
-        if not f.exists():
-            np.save(f.as_posix(), cv2.imread(self.im_files[i]), allow_pickle=False)
-
-    def check_cache_ram(self, safety_margin=0.5):
-        """Check image caching requirements vs available memory."""
-        b, gb = 0, 1 << 30  # bytes of cached images, bytes per gigabytes
-        n = min(self.ni, 30)  # extrapolate from 30 random images
-        for _ in range(n):
-            im = cv2.imread(random.choice(self.im_files))  # sample image
-            ratio = self.imgsz / max(im.shape[0], im.shape[1])  # max(h, w)  # ratio
-            b += im.nbytes * ratio ** 2
-        mem_required = b * self.ni / n * (1 + safety_margin)  # GB required to cache dataset into RAM
+    def check_cache_ram(self, safety_margin=0.5, shapes=None):
+        """Check image caching requirements vs available memory, sized from the *.h5 dataset shapes or `shapes`."""
+        _, hw, c = self.frame_shapes() if shapes is None else shapes
+        gb = 1 << 30  # bytes per gigabytes
+        mem_required = int(hw.prod(1).sum()) * c * (1 + safety_margin)  # GB required to cache dataset into RAM
         mem = psutil.virtual_memory()
         cache = mem_required < mem.available  # to cache or not to cache, that is the question
         if not cache:
@@ -246,7 +341,10 @@ class BaseDataset(Dataset):
 
     def get_image_and_label(self, index):
         """Get and return label information from the dataset."""
-        label = deepcopy(self.labels[index])  # requires deepcopy() https://github.com/ultralytics/ultralytics/pull/1948
+        label = self.labels[index].copy()  # shallow, arrays are handed out as read-only views, see readonly()
+        for k in 'cls', 'bboxes', 'keypoints':
+            if label.get(k) is not None:
+                label[k] = readonly(label[k])
         label.pop('shape', None)  # shape is for rect, remove it
         label['img'], label['ori_shape'], label['resized_shape'], label['im_file'] = self.load_image(index)
         label['ratio_pad'] = (label['resized_shape'][0] / label['ori_shape'][0],
@@ -1,16 +1,22 @@
 # Ultralytics YOLO 🚀, AGPL-3.0 license
 
+import contextlib
+import math
 import os
+import queue
 import random
+import time
 from pathlib import Path
+from threading import Event, Thread
 
 import numpy as np
 import torch
 from PIL import Image
+from torch import distributed as dist
 from torch.utils.data import dataloader, distributed
 
-from ultralytics.data.loaders import (LOADERS, LoadImages, LoadPilAndNumpy, LoadScreenshots, LoadStreams, LoadTensor,
-                                      SourceTypes, autocast_list)
+from ultralytics.data.loaders import (LOADERS, LoadEventHistograms, LoadImages, LoadPilAndNumpy, LoadScreenshots,
+                                      LoadStreams, LoadTensor, SourceTypes, autocast_list)
 from ultralytics.data.utils import IMG_FORMATS, VID_FORMATS
 from ultralytics.utils import RANK, colorstr
 from ultralytics.utils.checks import check_file
@@ -44,6 +50,91 @@ class InfiniteDataLoader(dataloader.DataLoader):
         self.iterator = self._get_iterator()
 
 
+class DevicePrefetcher:
+    """
+    Iterate a DataLoader with the following batches already fetched and preprocessed, i.e. moved to the device,
+    converted and normalised, while the current batch is in the forward and backward pass.
+
+    A background thread fetches batches from `loader` and applies `preprocess`, on CUDA devices inside a side stream
+    whose work the consumer stream waits for, so host-to-device copies overlap compute. A new thread is started for
+    every pass over `loader`, so epoch settings such as `close_mosaic` and `sampler.set_epoch()` apply as before.
+    Autocast is thread-local, so `preprocess` is run under `amp` autocast in the thread, as in the synchronous loop.
+
+    Args:
+        loader (Iterable): DataLoader, usually an InfiniteDataLoader.
+        preprocess (callable): Batch preprocessing, i.e. `DetectionTrainer.preprocess_batch`.
+        device (torch.device): Device `preprocess` moves batches to.
+        depth (int, optional): Number of batches prepared ahead. Defaults to 1.
+        amp (bool, optional): Run `preprocess` under CUDA autocast. Defaults to False.
+
+    Attributes:
+        wait (float): Seconds the consumer waited for batches during the last pass.
+        t (float): Seconds spent in `preprocess` during the last pass, including its device work.
+    """
+
+    def __init__(self, loader, preprocess, device, depth=1, amp=False):
+        """Wrap `loader` without starting to fetch."""
+        self.loader = loader
+        self.preprocess = preprocess
+        self.device = torch.device(device)
+        self.depth = depth
+        self.amp = amp
+        self.wait = 0.0
+        self.t = 0.0
+
+    def __len__(self):
+        """Return the number of batches of one pass."""
+        return len(self.loader)
+
+    def _prefetch(self, q, stop, stream):
+        """Fetch and preprocess batches into queue `q` until the loader is exhausted or `stop` is set."""
+        try:
+            with torch.cuda.stream(stream) if stream else contextlib.nullcontext(), torch.cuda.amp.autocast(self.amp):
+                for batch in self.loader:
+                    if stop.is_set():
+                        return
+                    t = time.perf_counter()
+                    batch = self.preprocess(batch)
+                    event = stream.record_event() if stream else None
+                    if event is not None:
+                        event.synchronize()  # blocks this thread only, so `t` includes the copies
+                    self.t += time.perf_counter() - t
+                    q.put((batch, event))
+        except Exception as e:
+            q.put((e, None))
+        q.put((None, None))
+
+    def __iter__(self):
+        """Yield preprocessed batches, recording in `wait` how long each one was waited for."""
+        q, stop = queue.Queue(maxsize=self.depth), Event()
+        stream = torch.cuda.Stream(self.device) if self.device.type == 'cuda' else None
+        thread = Thread(target=self._prefetch, args=(q, stop, stream), daemon=True)
+        thread.start()
+        self.wait = self.t = 0.0
+        try:
+            while True:
+                t = time.perf_counter()
+                batch, event = q.get()
+                self.wait += time.perf_counter() - t
+                if batch is None:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                if event is not None:  # consumer stream waits for the side stream, its tensors are not freed early
+                    current = torch.cuda.current_stream(self.device)
+                    current.wait_event(event)
+                    for v in batch.values():
+                        if isinstance(v, torch.Tensor) and v.is_cuda:
+                            v.record_stream(current)
+                yield batch
+        finally:
+            stop.set()
+            while thread.is_alive():  # unblock a pending put()
+                with contextlib.suppress(queue.Empty):
+                    q.get_nowait()
+                thread.join(timeout=0.01)
+
+
 class _RepeatSampler:
     """
     Sampler that repeats forever.
@@ -62,6 +153,141 @@ class _RepeatSampler:
             yield from iter(self.sampler)
 
 
+class ChunkLocalitySampler(torch.utils.data.Sampler):
+    """
+    Sampler that shuffles event frames in blocks of consecutive frames of the same recording.
+
+    Frames are grouped into the aligned `block_size` frame blocks that `BaseDataset.read_frame()` reads as one slab. The
+    order of the blocks is shuffled, then the frames inside each block, so consecutive samples hit the same slab and
+    *.h5 chunks while every epoch still visits the dataset in a new random order.
+
+    Args:
+        dataset (BaseDataset): Event dataset whose labels hold `im_file=[file_idx, frame_idx]`.
+        block_size (int): Number of consecutive frames per block, usually `dataset.slab_size`.
+        seed (int, optional): Base seed, the seed of each epoch is `seed + epoch`. Defaults to 0.
+    """
+
+    def __init__(self, dataset, block_size, seed=0):
+        """Group dataset indices by recording and frame block."""
+        self.block_size = block_size
+        self.seed = seed
+        self.epoch = 0
+        im_files = np.array([lb['im_file'] for lb in dataset.labels], dtype=np.int64).reshape(-1, 2)
+        _, block = np.unique(im_files[:, 0] * (1 << 32) + im_files[:, 1] // block_size, return_inverse=True)
+        order = np.argsort(block, kind='stable')
+        self.blocks = np.split(order, np.flatnonzero(np.diff(block[order])) + 1) if len(order) else []
+
+    def __iter__(self):
+        """Yield dataset indices block by block, shuffled at block level and within blocks."""
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        self.epoch += 1  # new order every time the sampler is iterated, i.e. every epoch
+        for b in torch.randperm(len(self.blocks), generator=g).tolist():
+            block = self.blocks[b]
+            yield from block[torch.randperm(len(block), generator=g).numpy()].tolist()
+
+    def __len__(self):
+        """Return the number of samples."""
+        return sum(len(b) for b in self.blocks)
+
+    def set_epoch(self, epoch):
+        """Set the epoch used to seed the next shuffle."""
+        self.epoch = epoch
+
+
+class RecordingShardSampler(torch.utils.data.Sampler):
+    """
+    Sampler that shards event datasets by recording across DDP ranks and DataLoader workers.
+
+    Every epoch whole recordings, or with `shard_size > 0` the aligned blocks of `shard_size` consecutive frames of a
+    recording, are shuffled and assigned largest first to the one of `num_replicas * workers` shards with the fewest
+    samples. All ranks compute the same assignment and yield only their own shards, ordered so that DataLoader worker
+    w, which receives batches w, w + workers, w + 2 * workers, ... of the rank, reads only the recordings of its shard.
+    Open *.h5 files and duplicated page cache then scale with 1 / (num_replicas * workers) of the dataset instead of
+    staying constant per rank and worker.
+
+    All shards hold `ceil(len(dataset) / (num_replicas * workers * batch_size))` full batches, shorter shards are padded
+    with their own samples and longer ones truncated, so every rank and worker runs the same number of steps. Within a
+    shard samples are shuffled, in blocks of `block_size` frames like `ChunkLocalitySampler` if `block_size > 0`.
+
+    Args:
+        dataset (BaseDataset): Event dataset whose labels hold `im_file=[file_idx, frame_idx]`.
+        batch_size (int): Batch size per rank.
+        workers (int, optional): Number of DataLoader workers per rank, 0 to load in the main process. Defaults to 0.
+        shard_size (int, optional): Frames per contiguous block of a recording, 0 to assign whole recordings. Defaults
+            to 0.
+        block_size (int, optional): Frames per block shuffled together within a shard, usually `dataset.slab_size`.
+            Defaults to 0.
+        num_replicas (int, optional): Number of DDP ranks, defaults to the world size of the process group.
+        rank (int, optional): DDP rank of this process, -1 or None without DDP. Defaults to None.
+        seed (int, optional): Base seed shared by all ranks, the seed of each epoch is `seed + epoch`. Defaults to 0.
+    """
+
+    def __init__(self, dataset, batch_size, workers=0, shard_size=0, block_size=0, num_replicas=None, rank=None,
+                 seed=0):
+        """Group dataset indices by recording or recording block."""
+        if rank is None or rank == -1:
+            num_replicas, rank = 1, 0
+        elif num_replicas is None:
+            num_replicas = dist.get_world_size()
+        self.batch_size = batch_size
+        self.workers = max(workers, 1)
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        im_files = np.array([lb['im_file'] for lb in dataset.labels], dtype=np.int64).reshape(-1, 2)
+        unit = im_files[:, 0] * (1 << 32) + (im_files[:, 1] // shard_size if shard_size else 0)
+        _, unit = np.unique(unit, return_inverse=True)
+        order = np.argsort(unit, kind='stable')
+        self.units = np.split(order, np.flatnonzero(np.diff(unit[order])) + 1) if len(order) else []
+        block = im_files[:, 0] * (1 << 32) + im_files[:, 1] // block_size if block_size else np.arange(len(im_files))
+        _, self.block = np.unique(block, return_inverse=True)  # shuffle block of every sample
+        shards = self.num_replicas * self.workers
+        self.num_batches = math.ceil(len(im_files) / (shards * batch_size))  # per shard
+
+    def shards(self, epoch):
+        """Return the dataset indices of the `num_replicas * workers` shards of `epoch`, worker w of rank r reads shard
+        r * workers + w."""
+        g = torch.Generator()
+        g.manual_seed(self.seed + epoch)
+        sizes = np.array([len(u) for u in self.units], dtype=np.int64)
+        perm = torch.randperm(len(self.units), generator=g).numpy()
+        load = np.zeros(self.num_replicas * self.workers, dtype=np.int64)
+        shards = [[] for _ in load]
+        for u in perm[np.argsort(-sizes[perm], kind='stable')]:  # largest first, equal sizes in random order
+            s = load.argmin()
+            shards[s].append(self.units[u])
+            load[s] += sizes[u]
+        return [np.concatenate(s) if s else np.zeros(0, dtype=np.int64) for s in shards]
+
+    def __iter__(self):
+        """Yield the dataset indices of this rank, batch b read by worker b % workers."""
+        epoch = self.epoch
+        self.epoch += 1  # new assignment every time the sampler is iterated, i.e. every epoch
+        shards = self.shards(epoch)[self.rank * self.workers:(self.rank + 1) * self.workers]
+        fallback = np.concatenate(shards) if sum(map(len, shards)) else np.concatenate(self.units)
+        g = torch.Generator()
+        g.manual_seed(self.seed + epoch + (self.rank + 1) * (1 << 32))  # shuffle within shards, different per rank
+        n = self.num_batches * self.batch_size
+        for i, idx in enumerate(shards):
+            idx = idx if len(idx) else fallback  # more shards than recordings, pad from the other shards of the rank
+            idx = idx[torch.randperm(len(idx), generator=g).numpy()]
+            key = torch.randperm(len(self.block), generator=g).numpy()[self.block[idx]]  # random order of blocks
+            shards[i] = np.resize(idx[np.argsort(key, kind='stable')], n)  # pad cyclically or truncate
+        batches = np.stack(shards).reshape(self.workers, self.num_batches, self.batch_size)
+        yield from batches.transpose(1, 0, 2).ravel().tolist()  # batch b of worker w at position b * workers + w
+
+    def __len__(self):
+        """Return the number of samples of this rank."""
+        return self.workers * self.num_batches * self.batch_size
+
+    def set_epoch(self, epoch):
+        """Set the epoch used to seed the next assignment, epochs only move forward so that ranks whose DataLoader
+        already prefetched the next epoch keep agreeing with the others."""
+        self.epoch = max(self.epoch, epoch)
+
+
 def seed_worker(worker_id):  # noqa
     """Set dataloader worker seed https://pytorch.org/docs/stable/notes/randomness.html#dataloader."""
     worker_seed = torch.initial_seed() % 2 ** 32
@@ -95,9 +321,15 @@ def build_dataloader(dataset, batch, workers, shuffle=True, rank=-1):
     batch = min(batch, len(dataset))
     nd = torch.cuda.device_count()  # number of CUDA devices
     nw = min([os.cpu_count() // max(nd, 1), batch if batch > 1 else 0, workers])  # number of workers
-    sampler = None if rank == -1 else distributed.DistributedSampler(dataset, shuffle=shuffle)
+    events = getattr(dataset, 'events', {})
+    if shuffle and events.get('shard_recordings'):  # each rank and worker reads its own recordings
+        sampler = RecordingShardSampler(dataset, batch, nw, events['shard_size'], dataset.slab_size, rank=rank)
+    else:
+        sampler = None if rank == -1 else distributed.DistributedSampler(dataset, shuffle=shuffle)
     generator = torch.Generator()
     generator.manual_seed(6148914691236517205 + RANK)
+    if sampler is None and shuffle and getattr(dataset, 'slab_size', 0):  # chunk-local shuffling for slab reads
+        sampler = ChunkLocalitySampler(dataset, dataset.slab_size, seed=generator.initial_seed())
     return InfiniteDataLoader(dataset=dataset,
                               batch_size=batch,
                               shuffle=shuffle and sampler is None,
@@ -111,9 +343,10 @@ def build_dataloader(dataset, batch, workers, shuffle=True, rank=-1):
 
 def check_source(source):
     """Check source type and return corresponding flag values."""
-    webcam, screenshot, from_img, in_memory, tensor = False, False, False, False, False
+    webcam, screenshot, from_img, in_memory, tensor, events = False, False, False, False, False, False
     if isinstance(source, (str, int, Path)):  # int for local usb camera
         source = str(source)
+        events = Path(source).suffix[1:].lower() == 'h5' or (Path(source).is_dir() and any(Path(source).glob('*.h5')))
         is_file = Path(source).suffix[1:] in (IMG_FORMATS + VID_FORMATS)
         is_url = source.lower().startswith(('https://', 'http://', 'rtsp://', 'rtmp://'))
         webcam = source.isnumeric() or source.endswith('.streams') or (is_url and not is_file)
@@ -132,10 +365,10 @@ def check_source(source):
     else:
         raise TypeError('Unsupported image type. For supported types see https://docs.ultralytics.com/modes/predict')
 
-    return source, webcam, screenshot, from_img, in_memory, tensor
+    return source, webcam, screenshot, from_img, in_memory, tensor, events
 
 
-def load_inference_source(source=None, imgsz=640, vid_stride=1, buffer=False):
+def load_inference_source(source=None, imgsz=640, vid_stride=1, buffer=False, batch=1, ch=None):
     """
     Loads an inference source for object detection and applies necessary transformations.
 
@@ -144,12 +377,14 @@ def load_inference_source(source=None, imgsz=640, vid_stride=1, buffer=False):
         imgsz (int, optional): The size of the image for inference. Default is 640.
         vid_stride (int, optional): The frame interval for video sources. Default is 1.
         buffer (bool, optional): Determined whether stream frames will be buffered. Default is False.
+        batch (int, optional): Number of frames per batch for *.h5 event recordings. Default is 1.
+        ch (int, optional): Model input channels, *.h5 event histograms are stacked to match. Default is None.
 
     Returns:
         dataset (Dataset): A dataset object for the specified input source.
     """
-    source, webcam, screenshot, from_img, in_memory, tensor = check_source(source)
-    source_type = source.source_type if in_memory else SourceTypes(webcam, screenshot, from_img, tensor)
+    source, webcam, screenshot, from_img, in_memory, tensor, events = check_source(source)
+    source_type = source.source_type if in_memory else SourceTypes(webcam, screenshot, from_img, tensor, events)
 
     # Dataloader
     if tensor:
@@ -162,6 +397,8 @@ def load_inference_source(source=None, imgsz=640, vid_stride=1, buffer=False):
         dataset = LoadScreenshots(source, imgsz=imgsz)
     elif from_img:
         dataset = LoadPilAndNumpy(source, imgsz=imgsz)
+    elif events:
+        dataset = LoadEventHistograms(source, imgsz=imgsz, vid_stride=vid_stride, batch=batch, ch=ch)
     else:
         dataset = LoadImages(source, imgsz=imgsz, vid_stride=vid_stride)
 
@@ -8,7 +8,7 @@ from pathlib import Path
 import cv2
 import numpy as np
 
-from ultralytics.utils import TQDM
+from ultralytics.utils import LOGGER, TQDM
 
 
 def coco91_to_coco80_class():
@@ -232,6 +232,108 @@ def convert_dota_to_yolo_obb(dota_root_path: str):
             convert_label(image_name_without_ext, w, h, orig_label_dir, save_dir)
 
 
+def convert_events_to_store(events_dir, save_dir=None, packbits=False, histo_delta_t=50000, label_delta_t=100000,
+                            label_tolerance=0, histo_window=0, histo_clip=255, num_cls=None):
+    """
+    Packs a split of event recordings, one *.h5 histogram file and one *_bbox.npy label file each, into a single store.
+
+    The store holds all histograms as one contiguous (N, C, H, W) uint8 'frames.npy', read back memory-mapped by
+    `YOLODataset` when a dataset YAML split points at the store directory, and a flat label table 'labels.npz' in the
+    layout of the *.cache label index with labels already matched to histograms.
+
+    Args:
+        events_dir (str | Path): Split directory with *.h5 recordings and their *_bbox.npy labels.
+        save_dir (str | Path, optional): Store directory. Defaults to `<events_dir>_store` next to `events_dir`.
+        packbits (bool, optional): Bit-pack binarized histograms along W, 8x smaller, requires values in {0, 1}.
+        histo_delta_t (int, optional): Time span of one histogram (us), as 'histo_delta_t' of the dataset YAML.
+        label_delta_t (int, optional): Time between labelled frames (us), as 'label_delta_t' of the dataset YAML.
+        label_tolerance (int, optional): Max label timestamp distance (us), as 'label_tolerance' of the dataset YAML.
+        histo_window (int, optional): Time span of histograms built from raw events (us), 0 for `histo_delta_t`.
+        histo_clip (int, optional): Max event count per pixel of histograms built from raw events, 1 binarizes.
+        num_cls (int, optional): Number of classes, boxes of higher classes are dropped. Defaults to None, keep all.
+
+    Returns:
+        (Path): The store directory.
+
+    Example:
+        ```python
+        from ultralytics.data.converter import convert_events_to_store
+
+        convert_events_to_store('path/to/events/train', packbits=True)
+        ```
+    """
+    import h5py
+
+    from ultralytics.data.utils import events_frames, filter_events_labels, match_events_labels
+
+    events_dir = Path(events_dir)
+    save_dir = Path(save_dir or events_dir.parent / f'{events_dir.name}_store')
+    save_dir.mkdir(parents=True, exist_ok=True)
+    recordings = sorted(events_dir.rglob('*.h5'))
+    assert recordings, f'No *.h5 recordings found in {events_dir}'
+
+    # Frame offsets and shapes of all recordings
+    shapes = []
+    for f in recordings:
+        with h5py.File(f, 'r') as h5:
+            shapes.append(events_frames(h5, histo_delta_t, histo_window, histo_clip).shape)
+    shapes = np.array(shapes, dtype=np.int64)  # n, 4 (frames, c, h, w)
+    if (shapes[:, 1:] != shapes[0, 1:]).any():
+        raise ValueError(f'All recordings of {events_dir} must have the same (C, H, W), '
+                         f'but got {np.unique(shapes[:, 1:], axis=0).tolist()}')
+    recording_offsets = np.concatenate(([0], np.cumsum(shapes[:, 0])))
+    _, c, h, w = shapes[0].tolist()
+
+    # Frames, streamed one *.h5 chunk at a time into the memory-mapped store
+    tmp = save_dir / 'frames.npy.tmp'
+    frames = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8,
+                                       shape=(int(recording_offsets[-1]), c, h, (w + 7) // 8 if packbits else w))
+    files, frame_idx, steps, counts, cls, bboxes = [], [], [], [], [], []
+    dropped = 0  # degenerate, out of frame and invalid class boxes, as dropped by verify_events_label()
+    for i, f in enumerate(TQDM(recordings, desc=f'Converting {events_dir}')):
+        with h5py.File(f, 'r') as h5:
+            data = events_frames(h5, histo_delta_t, histo_window, histo_clip)
+            chunk = data.chunks[0] if getattr(data, 'chunks', None) else 64
+            for j in range(0, len(data), chunk):
+                x = data[j:j + chunk]
+                if packbits:
+                    if x.max(initial=0) > 1:
+                        raise ValueError(f'packbits=True requires binarized histograms, but {f} has values > 1')
+                    x = np.packbits(x, axis=-1)
+                frames[recording_offsets[i] + j:recording_offsets[i] + j + len(x)] = x
+        lb = f.with_name(f'{f.stem}_bbox.npy')
+        if lb.exists():
+            lb, n = filter_events_labels(np.load(lb), (h, w), num_cls)
+            dropped += sum(n)
+            labels = match_events_labels(lb, shapes[i, 0], (h, w), histo_delta_t, label_delta_t, label_tolerance)
+            for x, y in zip((frame_idx, steps, counts, cls, bboxes), labels):
+                x.append(y)
+            files.append(np.full(len(labels[0]), i, dtype=np.int64))
+    if dropped:
+        LOGGER.warning(f'WARNING ⚠️ {events_dir}: {dropped} degenerate, out of frame or invalid class boxes dropped')
+    frames.flush()
+    del frames
+    tmp.replace(save_dir / 'frames.npy')  # a partially written store is never picked up
+
+    # Flat label table, boxes of entry i are cls[offsets[i]:offsets[i + 1]]
+    np.savez(save_dir / 'labels.npz',
+             file_index=np.concatenate(files) if files else np.zeros(0, dtype=np.int64),
+             frame=np.concatenate(frame_idx) if frame_idx else np.zeros(0, dtype=np.int64),
+             step=np.concatenate(steps) if steps else np.zeros(0, dtype=np.int64),
+             offsets=np.concatenate(([0], np.cumsum(np.concatenate(counts) if counts else []))).astype(np.int64),
+             cls=np.concatenate(cls, 0) if cls else np.zeros((0, 1), dtype=np.float32),
+             bboxes=np.concatenate(bboxes, 0) if bboxes else np.zeros((0, 4), dtype=np.float32),
+             shape=np.tile([h, w], (len(recordings), 1)).astype(np.int64),
+             recordings=np.array([f.relative_to(events_dir).as_posix() for f in recordings]),
+             recording_offsets=recording_offsets.astype(np.int64),
+             width=w,
+             packed=packbits,
+             histo_delta_t=histo_delta_t,
+             label_delta_t=label_delta_t,
+             label_tolerance=label_tolerance)
+    return save_dir
+
+
 def min_index(arr1, arr2):
     """
     Find a pair of indexes with the shortest distance between two arrays of 2D points.
@@ -1,11 +1,10 @@
 # Ultralytics YOLO 🚀, AGPL-3.0 license
 import contextlib
 from itertools import repeat
-from multiprocessing.pool import ThreadPool
+from multiprocessing.pool import Pool, ThreadPool
 from pathlib import Path
 
 import cv2
-import h5py
 import numpy as np
 import torch
 import torchvision
@@ -14,10 +13,11 @@ from ultralytics.utils import LOCAL_RANK, NUM_THREADS, TQDM, colorstr, is_dir_wr
 
 from .augment import Compose, Format, Instances, LetterBox, classify_albumentations, classify_transforms, v8_transforms
 from .base import BaseDataset
-from .utils import HELP_URL, LOGGER, get_hash, img2label_paths, verify_image, verify_image_label
+from .utils import (HELP_URL, LOGGER, PIN_MEMORY, EventStore, check_events_dataset, get_hash, img2label_paths,
+                    verify_events_label, verify_image, verify_image_label)
 
 # Ultralytics dataset *.cache version, >= 1.0.0 for YOLOv8
-DATASET_CACHE_VERSION = '1.0.3'
+DATASET_CACHE_VERSION = '1.0.4'
 
 
 class YOLODataset(BaseDataset):
@@ -37,6 +37,10 @@ class YOLODataset(BaseDataset):
         self.use_segments = use_segments
         self.use_keypoints = use_keypoints
         self.data = data
+        self.events = check_events_dataset(data)  # event histogram settings
+        self.slab_size = self.events['slab_size']
+        self.temporal_stack = self.events['temporal_stack']
+        self.histograms = {k: self.events[k] for k in ('histo_delta_t', 'histo_window', 'histo_clip')}
         assert not (self.use_segments and self.use_keypoints), 'Can not use both segments and keypoints.'
         super().__init__(*args, **kwargs)
 
@@ -132,34 +136,136 @@ class YOLODataset(BaseDataset):
             LOGGER.warning(f'WARNING ⚠️ No labels found in {cache_path}, training may not work correctly. {HELP_URL}')
         return labels
 
+    def cache_events_labels(self, path=Path('./labels.cache')):
+        """Build the label index of event recordings and save it to a *.cache file.
+
+        Recordings are verified in a process pool by `verify_events_label()`, which checks the histogram shape, drops
+        degenerate, out of frame and invalid class boxes and matches the others to the nearest labelled frame with a
+        single sort per recording. Boxes are stored as concatenated `cls` and `bboxes` arrays, `offsets[i]:offsets[i +
+        1]` selecting the boxes of entry `i` of the index, which is histogram `frame[i]` of recording `file[i]` and
+        labelled frame `step[i]`. The per-recording statistics are kept in the cache as `report`.
+
+        Args:
+            path (Path): path where to save the cache file (default: Path('./labels.cache')).
+        Returns:
+            (dict): labels index.
+        """
+        x = {}
+        files, frames, steps, counts, cls, bboxes, shapes, report, msgs = [], [], [], [], [], [], [], [], []
+        desc = f'{self.prefix}Scanning {path.parent / path.stem}...'
+        nf, nu, nb, nd, nc = 0, 0, 0, 0, 0  # number of labelled frames, unlabelled frames, boxes, dropped, corrupt
+        total = len(self.im_files)
+        with Pool(max(min(NUM_THREADS, total), 1)) as pool:
+            results = pool.imap(func=verify_events_label,
+                                iterable=zip(self.im_files, self.label_files, repeat(self.prefix),
+                                             repeat(len(self.data['names'])), repeat(self.histograms),
+                                             repeat(self.events['label_delta_t']),
+                                             repeat(self.events['label_tolerance'])))
+            pbar = TQDM(enumerate(results), desc=desc, total=total)
+            for file_idx, (frame_idx, step, frame_counts, frame_cls, xywh, shape, nu_f, nd_f, nc_f, msg) in pbar:
+                shapes.append(shape)
+                files.append(np.full(len(frame_idx), file_idx, dtype=np.int64))
+                frames.append(frame_idx)
+                steps.append(step)
+                counts.append(frame_counts)
+                cls.append(frame_cls)
+                bboxes.append(xywh)
+                report.append((len(frame_idx), nu_f, len(frame_cls), nd_f, nc_f))
+                nf += len(frame_idx)
+                nu += nu_f
+                nb += len(frame_cls)
+                nd += nd_f
+                nc += nc_f
+                if msg:
+                    msgs.append(msg)
+                pbar.desc = f'{desc} {nf} frames, {nu} unlabelled, {nb} boxes, {nd} dropped, {nc} corrupt'
+            pbar.close()
+
+        if msgs:
+            LOGGER.info('\n'.join(msgs))
+        if nf == 0:
+            LOGGER.warning(f'{self.prefix}WARNING ⚠️ No labels found in {path}. {HELP_URL}')
+        x['index'] = {
+            'file': np.concatenate(files) if files else np.zeros(0, dtype=np.int64),
+            'frame': np.concatenate(frames) if frames else np.zeros(0, dtype=np.int64),
+            'step': np.concatenate(steps) if steps else np.zeros(0, dtype=np.int64),
+            'offsets': np.concatenate(([0], np.cumsum(np.concatenate(counts) if counts else []))).astype(np.int64),
+            'cls': np.concatenate(cls, 0) if cls else np.zeros((0, 1), dtype=np.float32),
+            'bboxes': np.concatenate(bboxes, 0) if bboxes else np.zeros((0, 4), dtype=np.float32),
+            'shape': np.array(shapes, dtype=np.int64).reshape(-1, 2)}
+        x['hash'] = get_hash(self.label_files + self.im_files)
+        x['events'] = {k: self.events[k] for k in ('histo_delta_t', 'label_delta_t', 'label_tolerance')}
+        x['report'] = dict(zip(('frames', 'unlabelled', 'boxes', 'dropped', 'corrupt'),
+                               np.array(report, dtype=np.int64).reshape(-1, 5).T))  # per recording
+        x['results'] = nf, nu, nb, nd, nc, len(self.im_files)
+        x['msgs'] = msgs  # warnings
+        save_dataset_cache_file(self.prefix, path, x)
+        return x
+
+    def load_events_cache(self, cache_path):
+        """Return the label index from `cache_path` and whether it existed, rebuilding it if missing or outdated."""
+        try:
+            cache = load_dataset_cache_file(cache_path)  # attempt to load a *.cache file
+            assert cache['version'] == DATASET_CACHE_VERSION  # matches current version
+            assert cache['hash'] == get_hash(self.label_files + self.im_files)  # identical hash
+            assert all(cache['events'][k] == v for k, v in self.events.items() if k in cache['events'])  # same binning
+            return cache, True
+        except (FileNotFoundError, AssertionError, AttributeError, KeyError):
+            return self.cache_events_labels(cache_path), False  # run cache ops
+
+    def load_store_labels(self):
+        """Return the label index of a converted store in the layout of `cache_events_labels()`."""
+        for k, v in self.store.events.items():
+            if self.events[k] != v:
+                raise ValueError(f"data YAML '{k}={self.events[k]}' does not match '{k}={v}' of the events store "
+                                 f'{self.store.path}, convert it again with the new value.')
+        index = self.store.index
+        return {'index': index, 'results': (len(index['file']), 0, len(index['cls']), 0, 0, len(self.im_files)),
+                'msgs': []}
+
+    def get_img_files(self, img_path):
+        """Read recording files, or open `img_path` as an EventStore written by `convert_events_to_store()`."""
+        if EventStore.is_store(img_path):
+            self.store = EventStore(img_path)
+            return self.store.im_files
+        return super().get_img_files(img_path)
+
     def get_events_labels(self):
+        """Returns a list of label dicts, one per labelled event frame, from the cached label index."""
         self.label_files = [x.rsplit('.', 1)[0] + '_bbox.npy' for x in self.im_files]
-        all_labels = []
-        for file_idx in range(len(self.im_files)):
-            with h5py.File(self.im_files[file_idx], "r") as h5_file:
-                num_frames, _, height, width = h5_file["data"].shape
-            labels = np.load(self.label_files[file_idx])
-            x_normalized, y_normalized, w_normalized, h_normalized = labels['x'] / width, labels['y'] / height, labels['w'] / width, labels['h'] / height
-            x_centered_normalized = x_normalized + w_normalized / 2
-            y_centered_normalized = y_normalized + h_normalized / 2
-            bboxes_normalized = np.stack((x_centered_normalized, y_centered_normalized, w_normalized, h_normalized), axis=1)
-            classes = labels["class_id"]
-            timestamps = labels['ts']
-            for frame_idx in range(num_frames):
-                box_idxs = np.nonzero(timestamps == (frame_idx+1) * 1e5)[0]
-                if len(box_idxs) > 0:
-                    all_labels.append(
-                        dict(
-                            im_file=[file_idx, frame_idx],
-                            shape=(height, width),
-                            cls=classes[box_idxs, np.newaxis],  # n, 1
-                            bboxes=bboxes_normalized[box_idxs, :],  # n, 4
-                            segments=[],
-                            keypoints=None,
-                            normalized=True,
-                            bbox_format='xywh'))
-        return all_labels
+        cache_path = Path(self.label_files[0]).parent.with_suffix('.cache')
+        if self.store is not None:  # converted store, the label table is part of the store
+            cache, exists, cache_path = self.load_store_labels(), True, self.store.path
+        else:
+            cache, exists = self.load_events_cache(cache_path)
 
+        # Display cache
+        nf, nu, nb, nd, nc, n = cache.pop('results')  # labelled, unlabelled frames, boxes, dropped, corrupt, total
+        if exists and LOCAL_RANK in (-1, 0):
+            d = f'Scanning {cache_path}... {nf} frames, {nu} unlabelled, {nb} boxes, {nd} dropped, {nc} corrupt'
+            TQDM(None, desc=self.prefix + d, total=n, initial=n)  # display results
+            if cache['msgs']:
+                LOGGER.info('\n'.join(cache['msgs']))  # display warnings
+
+        # Expand the index into per-frame label dicts, cls and bboxes are views into the concatenated arrays
+        index = cache['index']
+        offsets, shapes = index['offsets'], [tuple(x) for x in index['shape'].tolist()]
+        keep = np.flatnonzero(index['step'] % self.events['frame_stride'] == 0)  # temporal subsampling
+        labels = []
+        for i, file_idx, frame_idx in zip(keep.tolist(), index['file'][keep].tolist(), index['frame'][keep].tolist()):
+            labels.append(
+                dict(
+                    im_file=[file_idx, frame_idx],
+                    shape=shapes[file_idx],  # (height, width)
+                    cls=index['cls'][offsets[i]:offsets[i + 1]],  # n, 1
+                    bboxes=index['bboxes'][offsets[i]:offsets[i + 1]],  # n, 4
+                    segments=[],
+                    keypoints=None,
+                    normalized=True,
+                    bbox_format='xywh'))
+        if not labels:
+            LOGGER.warning(f'WARNING ⚠️ No labels found in {cache_path}, training may not work correctly. {HELP_URL}')
+        return labels
 
     def build_transforms(self, hyp=None):
         """Builds and appends transforms to the list."""
@@ -176,7 +282,8 @@ class YOLODataset(BaseDataset):
                    return_keypoint=self.use_keypoints,
                    batch_idx=True,
                    mask_ratio=hyp.mask_ratio,
-                   mask_overlap=hyp.overlap_mask))
+                   mask_overlap=hyp.overlap_mask,
+                   packbits=self.events['packbits']))
         return transforms
 
     def close_mosaic(self, hyp):
@@ -200,24 +307,37 @@ class YOLODataset(BaseDataset):
 
     @staticmethod
     def collate_fn(batch):
-        """Collates data samples into batches."""
+        """
+        Collates data samples into batches.
+
+        Images are stacked straight into the memory the batch is consumed from: shared memory in DataLoader workers, so
+        the batch reaches the main process without another copy, or pinned memory in the main process, so it is ready
+        for a non_blocking transfer without the extra copy of the DataLoader pin_memory thread. Pinned blocks are reused
+        by the CUDA caching host allocator. `batch_idx` is built by a single `repeat_interleave`.
+        """
         new_batch = {}
-        keys = batch[0].keys()
-        values = list(zip(*[list(b.values()) for b in batch]))
-        for i, k in enumerate(keys):
-            value = values[i]
+        for k in batch[0].keys():
+            value = [b[k] for b in batch]
             if k == 'img':
-                value = torch.stack(value, 0)
+                value = torch.stack(value, 0, out=collate_buffer(value))
             if k in ['masks', 'keypoints', 'bboxes', 'cls']:
                 value = torch.cat(value, 0)
             new_batch[k] = value
-        new_batch['batch_idx'] = list(new_batch['batch_idx'])
-        for i in range(len(new_batch['batch_idx'])):
-            new_batch['batch_idx'][i] += i  # add target image index for build_targets()
-        new_batch['batch_idx'] = torch.cat(new_batch['batch_idx'], 0)
+        counts = torch.tensor([len(x) for x in new_batch['batch_idx']])
+        new_batch['batch_idx'] = torch.arange(len(batch), dtype=torch.float32).repeat_interleave(counts)  # image index
         return new_batch
 
 
+def collate_buffer(tensors):
+    """Return an empty tensor for `torch.stack(tensors)`, in shared memory in DataLoader workers or else pinned."""
+    elem = tensors[0]
+    shape = (len(tensors), *elem.shape)
+    if torch.utils.data.get_worker_info() is not None:  # as torch default_collate, sent to the main process as is
+        storage = elem._typed_storage()._new_shared(sum(x.numel() for x in tensors), device=elem.device)
+        return elem.new(storage).resize_(shape)
+    return torch.empty(shape, dtype=elem.dtype, pin_memory=PIN_MEMORY and torch.cuda.is_available())
+
+
 # Classification dataloaders -------------------------------------------------------------------------------------------
 class ClassificationDataset(torchvision.datasets.ImageFolder):
     """
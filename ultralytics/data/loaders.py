@@ -1,8 +1,10 @@
 # Ultralytics YOLO 🚀, AGPL-3.0 license
 
+import contextlib
 import glob
 import math
 import os
+import queue
 import time
 from dataclasses import dataclass
 from pathlib import Path
@@ -10,12 +12,13 @@ from threading import Thread
 from urllib.parse import urlparse
 
 import cv2
+import h5py
 import numpy as np
 import requests
 import torch
 from PIL import Image
 
-from ultralytics.data.utils import IMG_FORMATS, VID_FORMATS
+from ultralytics.data.utils import IMG_FORMATS, VID_FORMATS, events_frames
 from ultralytics.utils import LOGGER, is_colab, is_kaggle, ops
 from ultralytics.utils.checks import check_requirements
 
@@ -26,6 +29,7 @@ class SourceTypes:
     screenshot: bool = False
     from_img: bool = False
     tensor: bool = False
+    events: bool = False
 
 
 class LoadStreams:
@@ -284,6 +288,117 @@ class LoadImages:
         return self.nf  # number of files
 
 
+class LoadEventHistograms:
+    """
+    YOLOv8 event histogram loader, i.e. `yolo predict source=recording.h5 batch=32`.
+
+    Streams the (N, C, H, W) 'data' histograms of *.h5 recordings as batches of consecutive (H, W, C) frames. Batches
+    are read ahead on a daemon thread so HDF5 reads overlap with inference, and never span two recordings. Recordings of
+    raw events are binned on read with the EVENTS_DEFAULTS histogram settings, see `EventHistograms`.
+
+    Models with `ch` a multiple T of the histogram channels C get T consecutive histograms per frame stacked oldest
+    first, as in `BaseDataset.read_frame()`. The last T - 1 histograms of a batch are kept in a ring buffer for the next
+    batch, so every histogram is read once however deep the stack is.
+    """
+
+    def __init__(self, path, imgsz=640, vid_stride=1, batch=1, prefetch=4, ch=None):
+        """Initialize the loader for an *.h5 file, a directory of *.h5 files or a list of them, stacking to `ch`."""
+
+        files = []
+        for p in sorted(path) if isinstance(path, (list, tuple)) else [path]:
+            p = Path(p).absolute()
+            if p.is_dir():
+                files.extend(sorted(str(x) for x in p.glob('*.h5')))
+            elif p.is_file():
+                files.append(str(p))
+            else:
+                raise FileNotFoundError(f'{p} does not exist')
+        if not files:
+            raise FileNotFoundError(f'No *.h5 event recordings found in {path}')
+
+        self.files = files
+        self.nf = len(files)  # number of files
+        self.imgsz = imgsz
+        self.vid_stride = vid_stride  # frame stride
+        self.bs = max(batch, 1)  # frames per batch, batch=-1 AutoBatch is not applicable to inference
+        self.mode = 'events'
+        self.prefetch = prefetch  # batches read ahead
+        self.frames = []  # number of frames per file after vid_stride
+        self.stack = 1  # histograms per frame
+        for f in files:
+            with h5py.File(f, 'r') as h5:
+                data = events_frames(h5)
+                self.frames.append(math.ceil(len(data) / vid_stride))
+                c = data.shape[1]  # histogram channels
+            if ch and ch % c:
+                raise ValueError(f'Model input channels ch={ch} are not a multiple of the {c} channels of {f}')
+            self.stack = ch // c if ch else 1
+        self.batch_frames = []  # frame indices of the current batch
+        self.running, self.thread, self.queue = False, None, None
+
+    def update(self):
+        """Read batches of frames of all files into the queue in a daemon thread."""
+        try:
+            step = self.bs * self.vid_stride
+            for i, f in enumerate(self.files):
+                with h5py.File(f, 'r') as h5:
+                    data = events_frames(h5)
+                    n, c, h, w = data.shape
+                    ring = np.zeros((self.stack - 1, c, h, w), dtype=np.uint8)  # last T - 1 histograms, zero at start
+                    for j in range(0, n, step):
+                        if not self.running:
+                            return
+                        if self.stack == 1:
+                            x = data[j:j + step:self.vid_stride]  # (n, c, h, w)
+                            x = np.ascontiguousarray(x.transpose(0, 2, 3, 1))  # (n, h, w, c)
+                        else:  # every histogram read once, strided frames are windows of the ring and the new reads
+                            x = np.concatenate((ring, data[j:j + step]))
+                            ring = x[len(x) - len(ring):]
+                            x = np.lib.stride_tricks.sliding_window_view(x, self.stack, axis=0)[::self.vid_stride]
+                            x = np.ascontiguousarray(x.transpose(0, 2, 3, 4, 1)).reshape(*x.shape[:1], h, w, -1)
+                        self.queue.put((i, range(j, j + len(x) * self.vid_stride, self.vid_stride), x))
+        except Exception as e:
+            self.queue.put(e)
+        self.queue.put(None)
+
+    def close(self):
+        """Stop the read-ahead thread."""
+        self.running = False
+        if self.thread and self.thread.is_alive():
+            with contextlib.suppress(queue.Empty):
+                while True:  # unblock a pending put()
+                    self.queue.get_nowait()
+            self.thread.join(timeout=5)
+
+    def __iter__(self):
+        """Start reading ahead from the first frame of the first file."""
+        self.close()
+        self.count, self.frame = 0, 0
+        self.queue, self.running = queue.Queue(maxsize=self.prefetch), True
+        self.thread = Thread(target=self.update, daemon=True)
+        self.thread.start()
+        return self
+
+    def __next__(self):
+        """Return the next batch of file paths and (H, W, C) frames."""
+        x = self.queue.get()
+        if x is None:
+            self.running = False
+            raise StopIteration
+        if isinstance(x, Exception):
+            self.close()
+            raise x
+        self.count, self.batch_frames, ims = x
+        self.frame = self.batch_frames[-1] // self.vid_stride + 1
+        path = self.files[self.count]
+        s = f'events {self.count + 1}/{self.nf} ({self.frame}/{self.frames[self.count]}) {path}: '
+        return [path] * len(ims), list(ims), None, s
+
+    def __len__(self):
+        """Returns the number of files in the object."""
+        return self.nf  # number of files
+
+
 class LoadPilAndNumpy:
 
     def __init__(self, im0, imgsz=640):
@@ -386,7 +501,7 @@ def autocast_list(source):
     return files
 
 
-LOADERS = LoadStreams, LoadPilAndNumpy, LoadImages, LoadScreenshots  # tuple
+LOADERS = LoadStreams, LoadPilAndNumpy, LoadImages, LoadScreenshots, LoadEventHistograms  # tuple
 
 
 def get_best_youtube_url(url, use_pafy=False):
@@ -5,14 +5,20 @@ import hashlib
 import json
 import os
 import random
+import shutil
 import subprocess
+import threading
 import time
+import weakref
 import zipfile
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
 from tarfile import is_tarfile
 
 import cv2
+import h5py
 import numpy as np
 from PIL import Image, ImageOps
 
@@ -27,6 +33,19 @@ HELP_URL = 'See https://docs.ultralytics.com/datasets/detect for dataset formatt
 IMG_FORMATS = 'bmp', 'dng', 'jpeg', 'jpg', 'mpo', 'png', 'tif', 'tiff', 'webp', 'pfm'  # image suffixes
 VID_FORMATS = 'asf', 'avi', 'gif', 'm4v', 'mkv', 'mov', 'mp4', 'mpeg', 'mpg', 'ts', 'wmv', 'webm'  # video suffixes
 PIN_MEMORY = str(os.getenv('PIN_MEMORY', True)).lower() == 'true'  # global pin_memory for dataloaders
+H5_MAX_OPEN = int(os.getenv('H5_MAX_OPEN', 16))  # max open *.h5 files per dataloader worker
+EVENTS_DEFAULTS = {  # event histogram settings, override in the dataset YAML
+    'histo_delta_t': 50000,  # (int) time span of one histogram in the *.h5 'data' array (us)
+    'label_delta_t': 100000,  # (int) time between labelled frames (us), frame k is labelled at ts=(k+1)*label_delta_t
+    'label_tolerance': 0,  # (int) max distance of a label timestamp to its labelled frame (us)
+    'frame_stride': 1,  # (int) use every n-th labelled frame
+    'slab_size': 0,  # (int) frames per contiguous *.h5 read and chunk-local shuffle block, 0 to disable
+    'packbits': False,  # (bool) binarize histograms and batch them bit-packed along W, unpacked on the device
+    'histo_window': 0,  # (int) time span of one histogram built from raw events (us), 0 for histo_delta_t
+    'histo_clip': 255,  # (int) max event count per pixel and polarity of histograms built from raw events, 1 binarizes
+    'temporal_stack': 1,  # (int) consecutive histograms per sample, stacked oldest first as C * temporal_stack channels
+    'shard_recordings': False,  # (bool) train each DDP rank and dataloader worker on its own recordings, reshuffled
+    'shard_size': 0}  # (int) frames per contiguous recording block assigned by shard_recordings, 0 for whole recordings
 
 
 def img2label_paths(img_paths):
@@ -153,6 +172,305 @@ def verify_image_label(args):
         return [None, None, None, None, None, nm, nf, ne, nc, msg]
 
 
+class H5FilePool:
+    """
+    LRU pool of read-only HDF5 file handles shared by all samples of a dataset.
+
+    Opening an *.h5 file parses its superblock and B-tree, which is far more expensive than reading a single frame, so
+    handles are kept open and reused across `__getitem__` calls. Handles are owned by the process that opened them:
+    after a fork (i.e. in a DataLoader worker) or unpickling (spawned workers) the pool starts empty and reopens files
+    lazily, so no HDF5 handle is ever shared between processes.
+
+    Attributes:
+        max_open (int): Maximum number of files kept open at the same time, least recently used files are closed first.
+        hits (int): Number of `get()` calls served by an already open handle.
+        misses (int): Number of `get()` calls that had to open a file.
+        evictions (int): Number of handles closed to stay within `max_open`.
+    """
+
+    def __init__(self, max_open=H5_MAX_OPEN):
+        """Initialize an empty pool holding at most `max_open` open files."""
+        self.max_open = max(int(max_open), 1)
+        self._lock = threading.Lock()  # cache_images() reads from a ThreadPool
+        self._reset()
+
+    def _reset(self):
+        """Forget all handles and counters, used on creation and in a new process."""
+        self._files = OrderedDict()
+        self._pid = os.getpid()
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def get(self, path):
+        """Return an open read-only `h5py.File` for `path`, opening it if needed."""
+        with self._lock:
+            if self._pid != os.getpid():  # forked worker, inherited handles belong to the parent process
+                self._reset()
+            f = self._files.get(path)
+            if f is not None:
+                self._files.move_to_end(path)
+                self.hits += 1
+                return f
+            self.misses += 1
+            while len(self._files) >= self.max_open:
+                self._files.popitem(last=False)[1].close()
+                self.evictions += 1
+            f = self._files[path] = h5py.File(path, 'r')
+            return f
+
+    def close(self):
+        """Close all open handles owned by this process."""
+        with self._lock:
+            if self._pid == os.getpid():
+                for f in self._files.values():
+                    f.close()
+            self._files.clear()
+
+    @property
+    def stats(self):
+        """Return a dict of pool counters for the current process."""
+        n = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'open': len(self._files),
+            'hit_rate': self.hits / n if n else 0.0}
+
+    def __len__(self):
+        """Return the number of currently open files."""
+        return len(self._files)
+
+    def __getstate__(self):
+        """Drop handles and lock when pickled for spawned DataLoader workers."""
+        return {'max_open': self.max_open}
+
+    def __setstate__(self, state):
+        """Recreate an empty pool after unpickling."""
+        self.__init__(state['max_open'])
+
+
+class EventStore:
+    """
+    Read-only view of a split converted by `convert_events_to_store()`, a drop-in for H5FilePool.
+
+    All histograms are one memory-mapped (N, C, H, W) uint8 array, optionally bit-packed along W, and `get(path)`
+    returns `{'data': frames}` of a single recording so reads are plain array slices with no HDF5 overhead.
+
+    Args:
+        path (str | Path): Store directory holding 'frames.npy' and 'labels.npz'.
+
+    Attributes:
+        im_files (list): Recording paths the store was converted from, in store order.
+        index (dict): Label index in the layout of `YOLODataset.cache_events_labels()`.
+        events (dict): 'histo_delta_t', 'label_delta_t' and 'label_tolerance' the labels were matched with.
+    """
+
+    def __init__(self, path):
+        """Memory-map the frames and load the label table of the store at `path`."""
+        self.path = Path(path)
+        with np.load(self.path / 'labels.npz') as x:
+            meta = {k: x[k] for k in x.files}
+        self.im_files = [str(self.path / f) for f in meta.pop('recordings').tolist()]  # relative to the source split
+        self.recording_offsets = meta.pop('recording_offsets')
+        self.width = int(meta.pop('width'))
+        self.packed = bool(meta.pop('packed'))
+        self.events = {k: int(meta.pop(k)) for k in ('histo_delta_t', 'label_delta_t', 'label_tolerance')}
+        self.index = {'file': meta.pop('file_index'), **meta}  # 'file' is taken by np.savez()
+        self.frames = np.load(self.path / 'frames.npy', mmap_mode='r')
+        self._views = {f: _StoreFrames(self, i) for i, f in enumerate(self.im_files)}
+
+    @staticmethod
+    def is_store(path):
+        """Return True if `path` is a store directory written by `convert_events_to_store()`."""
+        return isinstance(path, (str, Path)) and (Path(path) / 'frames.npy').is_file() and \
+            (Path(path) / 'labels.npz').is_file()
+
+    def get(self, path):
+        """Return `{'data': frames}` of the recording converted from `path`, indexed like an *.h5 'data' dataset."""
+        return {'data': self._views[path]}
+
+    def close(self):
+        """Nothing to close, memory maps are released with the store."""
+
+    def __getstate__(self):
+        """Only pass the store path to spawned DataLoader workers, which re-map the files."""
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        """Re-open the store after unpickling."""
+        self.__init__(state['path'])
+
+
+class _StoreFrames:
+    """Frames of one recording of an EventStore, sliced like an *.h5 'data' dataset and unpacked if bit-packed."""
+
+    def __init__(self, store, i):
+        """Select recording `i` of `store`."""
+        start, stop = store.recording_offsets[i:i + 2].tolist()
+        self.frames, self.packed, self.width = store.frames[start:stop], store.packed, store.width
+        self.shape = (stop - start, *self.frames.shape[1:3], self.width)
+
+    def __len__(self):
+        """Return the number of frames."""
+        return self.shape[0]
+
+    def __getitem__(self, item):
+        """Read frames, one contiguous copy out of the memory map."""
+        x = self.frames[item]
+        return np.unpackbits(x, axis=-1, count=self.width) if self.packed else np.array(x)
+
+
+class EventHistograms:
+    """
+    Histograms of a raw event recording built on read, sliced like an *.h5 'data' array of shape (N, 2, H, W).
+
+    Raw recordings store time-sorted events as 'events/x', 'events/y', 'events/p' and 'events/t' (us) arrays with
+    'height' and 'width' attributes on the 'events' group, and 'ms_to_idx', the index of the first event at or after
+    every millisecond. Histogram k counts the events of polarity p in channel p over [(k + 1) * delta_t - window,
+    (k + 1) * delta_t), the frames of a read share one contiguous read of the events and are binned by `np.bincount`.
+
+    Args:
+        h5 (h5py.File): Open raw recording.
+        delta_t (int): Time between histograms (us).
+        window (int, optional): Time span of one histogram (us), 0 for `delta_t`. Defaults to 0.
+        clip (int, optional): Max event count per pixel and polarity, 1 binarizes. Defaults to 255.
+    """
+
+    def __init__(self, h5, delta_t, window=0, clip=255):
+        """Open the event arrays of `h5`, no events are read until frames are sliced."""
+        events = h5['events']
+        self.x, self.y, self.p, self.t = (events[k] for k in 'xypt')
+        self.ms_to_idx = h5['ms_to_idx']
+        self.delta_t, self.window, self.clip = delta_t, window or delta_t, clip
+        n = int(self.t[-1]) // delta_t + 1 if len(self.t) else 0  # histograms up to the last event
+        self.shape = (n, 2, int(events.attrs['height']), int(events.attrs['width']))
+
+    def __len__(self):
+        """Return the number of histograms."""
+        return self.shape[0]
+
+    def index(self, ts):
+        """Return the index of the first event at or after `ts` (us), from 'ms_to_idx' and the 't' of 1 ms."""
+        ms = ts // 1000
+        if ms >= len(self.ms_to_idx):
+            return len(self.t)
+        i = self.ms_to_idx[ms:ms + 2].tolist()
+        i0, i1 = i[0], i[1] if len(i) > 1 else len(self.t)
+        return i0 + int(np.searchsorted(self.t[i0:i1], ts))
+
+    def __getitem__(self, item):
+        """Build histogram `item` (C, H, W) or the histograms of slice `item` (n, C, H, W) as uint8."""
+        frames = range(len(self))[item]
+        k = np.array([frames] if isinstance(frames, int) else frames, dtype=np.int64)
+        _, c, h, w = self.shape
+        x = np.zeros((len(k), c * h * w), dtype=np.uint8)
+        if len(k):
+            stop = (k + 1) * self.delta_t
+            start = np.maximum(stop - self.window, 0)
+            i0, i1 = self.index(int(start.min())), self.index(int(stop.max()))
+            t = self.t[i0:i1]
+            pixel = (self.p[i0:i1] > 0) * (h * w) + self.y[i0:i1].astype(np.int64) * w + self.x[i0:i1]
+            for j, (a, b) in enumerate(zip(np.searchsorted(t, start), np.searchsorted(t, stop))):
+                np.minimum(np.bincount(pixel[a:b], minlength=c * h * w), self.clip, out=x[j], casting='unsafe')
+        x = x.reshape(len(k), c, h, w)
+        return x[0] if isinstance(frames, int) else x
+
+
+def readonly(x):
+    """
+    Return a read-only view of array `x` without copying its data.
+
+    Label arrays of a dataset are views into its label index and are shared by every sample, transforms copy them on
+    their first in-place change, see `Bboxes.writeable()`, and `np.require(x, requirements='W')` gives a writeable copy.
+    """
+    x = x.view()
+    x.flags.writeable = False
+    return x
+
+
+def events_frames(h5, histo_delta_t=EVENTS_DEFAULTS['histo_delta_t'], histo_window=0, histo_clip=255):
+    """Return the (N, C, H, W) frames of an open *.h5 recording, its 'data' array or EventHistograms of raw events."""
+    return h5['data'] if 'data' in h5 else EventHistograms(h5, histo_delta_t, histo_window, histo_clip)
+
+
+class SharedArena:
+    """
+    Flat uint8 buffer in named shared memory, created once per node and attached by DataLoader workers and DDP ranks.
+
+    The last byte of the segment is a ready flag set by `set_ready()` once the buffer is filled, so processes attaching
+    to a complete segment can skip filling it. Pickling only transfers the segment name, spawned workers re-attach.
+
+    Args:
+        name (str): Segment name, identical across processes that should share the buffer.
+        size (int): Buffer size in bytes.
+    """
+
+    def __init__(self, name, size):
+        """Create the segment `name` or attach to it if another process already did, raises OSError if it can't fit."""
+        self.name, self.size = name, size
+        try:
+            free = shutil.disk_usage('/dev/shm').free if os.path.isdir('/dev/shm') else float('inf')
+            if free < size + 1:  # a sparse segment larger than /dev/shm raises SIGBUS on first write
+                raise OSError(f'{size / (1 << 30):.1f}GB shared memory required, only {free / (1 << 30):.1f}GB free')
+            self.shm, self.owner = shared_memory.SharedMemory(name=name, create=True, size=size + 1), True
+        except FileExistsError:
+            self._attach()
+        self._finalizer = weakref.finalize(self, self._release, self.shm, self.owner)
+        if self.shm.size < size + 1:
+            self.close()
+            raise OSError(f'shared memory segment {name} is smaller than {size + 1} bytes')
+        self.array = np.ndarray((size, ), dtype=np.uint8, buffer=self.shm.buf)
+
+    def _attach(self):
+        """Attach to an existing segment without taking ownership of it."""
+        self.shm, self.owner = shared_memory.SharedMemory(name=self.name), False
+        with contextlib.suppress(Exception):  # python<3.13 would otherwise unlink the segment when this process exits
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+    @property
+    def ready(self):
+        """Whether the buffer was completely filled by some process."""
+        return self.shm.buf[self.size] == 1
+
+    def set_ready(self):
+        """Mark the buffer as completely filled."""
+        self.shm.buf[self.size] = 1
+
+    def close(self):
+        """Detach from the segment, and remove it if this process created it."""
+        self.array = None
+        self._finalizer()
+
+    @staticmethod
+    def _release(shm, owner):
+        """Close `shm` and unlink it if owned, also run when the arena is garbage collected."""
+        with contextlib.suppress(BufferError):  # frames handed out by load_image() may still reference the buffer
+            shm.close()
+        if owner:
+            resource_tracker.register(shm._name, 'shared_memory')  # attaching in this process may have unregistered it
+            with contextlib.suppress(FileNotFoundError):
+                shm.unlink()
+
+    def __getitem__(self, item):
+        """Index the underlying uint8 buffer."""
+        return self.array[item]
+
+    def __setitem__(self, item, value):
+        """Write into the underlying uint8 buffer."""
+        self.array[item] = value
+
+    def __getstate__(self):
+        """Only pass the segment name to spawned DataLoader workers."""
+        return {'name': self.name, 'size': self.size}
+
+    def __setstate__(self, state):
+        """Re-attach to the segment after unpickling."""
+        self.name, self.size = state['name'], state['size']
+        self._attach()
+        self._finalizer = weakref.finalize(self, self._release, self.shm, self.owner)
+        self.array = np.ndarray((self.size, ), dtype=np.uint8, buffer=self.shm.buf)
+
+
 def polygon2mask(imgsz, polygons, color=1, downsample_ratio=1):
     """
     Args:
@@ -317,6 +635,130 @@ def check_det_dataset(dataset, autodownload=True):
     return data  # dictionary
 
 
+def check_events_dataset(data):
+    """
+    Return the event histogram settings of a dataset, using EVENTS_DEFAULTS for keys missing in the dataset YAML.
+
+    Args:
+        data (dict | None): Parsed dataset YAML dictionary.
+
+    Returns:
+        (dict): Event histogram settings with the keys of EVENTS_DEFAULTS.
+    """
+    cfg = {k: (data or {}).get(k, v) for k, v in EVENTS_DEFAULTS.items()}
+    for k, v in cfg.items():
+        if isinstance(EVENTS_DEFAULTS[k], bool):
+            if not isinstance(v, bool):
+                raise TypeError(f"data YAML '{k}={v}' is of invalid type {type(v).__name__}, '{k}' must be a bool.")
+            continue
+        if not isinstance(v, int) or isinstance(v, bool):
+            raise TypeError(f"data YAML '{k}={v}' is of invalid type {type(v).__name__}, '{k}' must be an int.")
+        if v < (0 if k in ('label_tolerance', 'slab_size', 'histo_window', 'shard_size') else 1):
+            raise ValueError(f"data YAML '{k}={v}' is an invalid value, '{k}' must be positive.")
+    if cfg['histo_clip'] > 255:
+        raise ValueError(f"data YAML 'histo_clip={cfg['histo_clip']}' is an invalid value, 'histo_clip' must be <= "
+                         '255.')
+    return cfg
+
+
+def match_events_labels(labels, num_frames, shape, histo_delta_t, label_delta_t, label_tolerance=0):
+    """
+    Match the boxes of one recording to its labelled histograms and group them by frame.
+
+    Frame k is labelled at ts = (k + 1) * label_delta_t and read from histogram k * label_delta_t / histo_delta_t, boxes
+    further than `label_tolerance` from a labelled frame or past the last histogram are dropped.
+
+    Args:
+        labels (np.ndarray): EventBbox structured array with 'ts', 'x', 'y', 'w', 'h' and 'class_id' fields.
+        num_frames (int): Number of histograms of the recording.
+        shape (tuple): Histogram (height, width).
+        histo_delta_t (int): Time span of one histogram (us).
+        label_delta_t (int): Time between labelled frames (us).
+        label_tolerance (int, optional): Max distance of a label timestamp to its labelled frame (us). Defaults to 0.
+
+    Returns:
+        frames (np.ndarray): (n, ) histogram index of every labelled frame.
+        steps (np.ndarray): (n, ) labelled frame index k of every labelled frame.
+        counts (np.ndarray): (n, ) number of boxes of every labelled frame.
+        cls (np.ndarray): (m, 1) float32 classes, grouped by frame in label file order.
+        bboxes (np.ndarray): (m, 4) float32 normalized center xywh boxes, grouped like `cls`.
+    """
+    ts = labels['ts'].astype(np.int64)
+    step = np.round(ts / label_delta_t).astype(np.int64) - 1
+    frame_idx = np.round(step * label_delta_t / histo_delta_t).astype(np.int64)
+    j = (np.abs(ts - (step + 1) * label_delta_t) <= label_tolerance) & (step >= 0) & (frame_idx < num_frames)
+    labels, step, frame_idx = labels[j], step[j], frame_idx[j]
+    order = np.argsort(step, kind='stable')  # stable keeps the box order of the label file
+    labels, step, frame_idx = labels[order], step[order], frame_idx[order]
+    steps, i, counts = np.unique(step, return_index=True, return_counts=True)  # boxes per frame
+
+    # Top-left xywh in pixels to normalized center xywh
+    height, width = shape
+    wh = np.array([width, height, width, height], dtype=np.float32)
+    xywh = np.stack((labels['x'], labels['y'], labels['w'], labels['h']), axis=1).astype(np.float32) / wh
+    xywh[:, :2] += xywh[:, 2:] / 2
+    return frame_idx[i], steps, counts, labels['class_id'].astype(np.float32).reshape(-1, 1), xywh
+
+
+def filter_events_labels(labels, shape, num_cls=None):
+    """
+    Drop the degenerate, out of frame and invalid class boxes of one recording.
+
+    Args:
+        labels (np.ndarray): EventBbox structured array with 'ts', 'x', 'y', 'w', 'h' and 'class_id' fields.
+        shape (tuple): Histogram (height, width).
+        num_cls (int, optional): Number of classes, boxes of higher classes are dropped. Defaults to None, keep all.
+
+    Returns:
+        labels (np.ndarray): Kept boxes in label file order.
+        dropped (tuple): Number of (degenerate, out of frame, invalid class) boxes dropped.
+    """
+    missing = [k for k in ('ts', 'x', 'y', 'w', 'h', 'class_id') if k not in (labels.dtype.names or ())]
+    assert not missing, f'label fields {missing} missing'
+    height, width = shape
+    x, y, w, h = (labels[k].astype(np.float64) for k in ('x', 'y', 'w', 'h'))
+    degenerate = ~np.isfinite(np.stack((x, y, w, h))).all(0) | (w <= 0) | (h <= 0)
+    outside = ~degenerate & ((x >= width) | (y >= height) | (x + w <= 0) | (y + h <= 0))
+    invalid = labels['class_id'] >= num_cls if num_cls is not None else np.zeros(len(labels), dtype=bool)
+    keep = ~(degenerate | outside | invalid)
+    return labels[keep], (int(degenerate.sum()), int(outside.sum()), int(invalid.sum()))
+
+
+def verify_events_label(args):
+    """Verify one event recording and its *_bbox.npy labels and match them with `match_events_labels()`."""
+    im_file, lb_file, prefix, num_cls, histograms, label_delta_t, label_tolerance = args
+    # Number (unlabelled frames, dropped boxes, corrupt), message, shape, matched labels
+    nu, nd, nc, msg, shape = 0, 0, 0, '', (0, 0)
+    empty = np.zeros(0, dtype=np.int64)
+    labels = empty, empty, empty, np.zeros((0, 1), dtype=np.float32), np.zeros((0, 4), dtype=np.float32)
+    try:
+        # Verify histograms
+        with h5py.File(im_file, 'r') as h5:
+            frames_shape = tuple(events_frames(h5, **histograms).shape)
+        assert len(frames_shape) == 4 and frames_shape[1] == 2, f'histograms {frames_shape} are not (N, 2, H, W)'
+        num_frames, _, height, width = frames_shape
+        assert num_frames > 0 and height > 0 and width > 0, f'empty histograms {frames_shape}'
+        shape = height, width
+
+        # Verify labels
+        lb = np.load(lb_file)
+        kept, (degenerate, outside, invalid) = filter_events_labels(lb, shape, num_cls)
+        labels = match_events_labels(kept, num_frames, shape, histograms['histo_delta_t'], label_delta_t,
+                                     label_tolerance)
+        unmatched = len(kept) - len(labels[3])  # boxes without a histogram within label_tolerance
+        nd = len(lb) - len(labels[3])
+        k = np.arange(num_frames * histograms['histo_delta_t'] // label_delta_t + 1)  # labelled frames of the recording
+        nu = int((np.round(k * label_delta_t / histograms['histo_delta_t']) < num_frames).sum()) - len(labels[0])
+        if nd:
+            counts = (degenerate, 'degenerate'), (outside, 'out of frame'), (invalid, f'class >= {num_cls}'), (
+                unmatched, 'without a matching frame')
+            msg = f'{prefix}WARNING ⚠️ {im_file}: {nd} boxes dropped, ' + ', '.join(f'{n} {s}' for n, s in counts if n)
+    except Exception as e:
+        nc = 1
+        msg = f'{prefix}WARNING ⚠️ {im_file}: ignoring corrupt recording/label: {e}'
+    return (*labels, shape, nu, nd, nc, msg)
+
+
 def check_cls_dataset(dataset, split=''):
     """
     Checks a classification dataset such as Imagenet.
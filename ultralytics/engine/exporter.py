@@ -185,7 +185,7 @@ class Exporter:
             raise SystemError('Edge TPU export only supported on Linux. See https://coral.ai/docs/edgetpu/compiler/')
 
         # Input
-        im = torch.zeros(self.args.batch, 3, *self.imgsz).to(self.device)
+        im = torch.zeros(self.args.batch, model.yaml.get('ch', 3), *self.imgsz).to(self.device)
         file = Path(
             getattr(model, 'pt_path', None) or getattr(model, 'yaml_file', None) or model.yaml.get('yaml_file', ''))
         if file.suffix in ('.yaml', '.yml'):
@@ -236,6 +236,7 @@ class Exporter:
             'stride': int(max(model.stride)),
             'task': model.task,
             'batch': self.args.batch,
+            'ch': im.shape[1],
             'imgsz': self.imgsz,
             'names': model.names}  # model metadata
         if model.task == 'pose':
@@ -117,11 +117,13 @@ class BasePredictor:
         not_tensor = not isinstance(im, torch.Tensor)
         if not_tensor:
             im = np.stack(self.pre_transform(im))
-            im = im[..., ::-1].transpose((0, 3, 1, 2))  # BGR to RGB, BHWC to BCHW, (n, 3, h, w)
-            im = np.ascontiguousarray(im)  # contiguous
+            if self.model.ch == 3:  # BGR to RGB, event histogram channels keep their polarity order
+                im = np.ascontiguousarray(im[..., ::-1])
             im = torch.from_numpy(im)
 
         im = im.to(self.device)
+        if not_tensor:
+            im = im.permute(0, 3, 1, 2).contiguous()  # BHWC to BCHW on the device, uint8 is copied to the device once
         im = im.half() if self.model.fp16 else im.float()  # uint8 to fp16/32
         if not_tensor:
             im /= 255  # 0 - 255 to 0.0 - 1.0
@@ -155,6 +157,8 @@ class BasePredictor:
         if self.source_type.webcam or self.source_type.from_img or self.source_type.tensor:  # batch_size >= 1
             log_string += f'{idx}: '
             frame = self.dataset.count
+        elif self.source_type.events:  # batch of consecutive frames of one recording
+            frame = self.dataset.batch_frames[idx]
         else:
             frame = getattr(self.dataset, 'frame', 0)
         self.data_path = p
@@ -207,9 +211,11 @@ class BasePredictor:
         self.dataset = load_inference_source(source=source,
                                              imgsz=self.imgsz,
                                              vid_stride=self.args.vid_stride,
-                                             buffer=self.args.stream_buffer)
+                                             buffer=self.args.stream_buffer,
+                                             batch=self.args.batch,
+                                             ch=self.model.ch)
         self.source_type = self.dataset.source_type
-        if not getattr(self, 'stream', True) and (self.dataset.mode == 'stream' or  # streams
+        if not getattr(self, 'stream', True) and (self.dataset.mode in ('stream', 'events') or  # streams
                                                   len(self.dataset) > 1000 or  # images
                                                   any(getattr(self.dataset, 'video_flag', [False]))):  # videos
             LOGGER.warning(STREAM_WARNING)
@@ -234,7 +240,8 @@ class BasePredictor:
 
         # Warmup model
         if not self.done_warmup:
-            self.model.warmup(imgsz=(1 if self.model.pt or self.model.triton else self.dataset.bs, 2, *self.imgsz))
+            bs = 1 if self.model.pt or self.model.triton else self.dataset.bs
+            self.model.warmup(imgsz=(bs, self.model.ch, *self.imgsz))
             self.done_warmup = True
 
         self.seen, self.windows, self.batch, profilers = 0, [], None, (ops.Profile(), ops.Profile(), ops.Profile())
@@ -292,7 +299,7 @@ class BasePredictor:
         if self.args.verbose and self.seen:
             t = tuple(x.t / self.seen * 1E3 for x in profilers)  # speeds per image
             LOGGER.info(f'Speed: %.1fms preprocess, %.1fms inference, %.1fms postprocess per image at shape '
-                        f'{(1, 3, *im.shape[2:])}' % t)
+                        f'{(1, im.shape[1], *im.shape[2:])}' % t)
         if self.args.save or self.args.save_txt or self.args.save_crop:
             nl = len(list(self.save_dir.glob('labels/*.txt')))  # number of labels
             s = f"\n{nl} label{'s' * (nl > 1)} saved to {self.save_dir / 'labels'}" if self.args.save_txt else ''
@@ -327,6 +334,8 @@ class BasePredictor:
     def save_preds(self, vid_cap, idx, save_path):
         """Save video predictions as mp4 at specified path."""
         im0 = self.plotted_img
+        if self.dataset.mode == 'events':  # batches are consecutive frames of one recording, written to one video
+            idx = 0
         # Save imgs
         if self.dataset.mode == 'image':
             cv2.imwrite(save_path, im0)
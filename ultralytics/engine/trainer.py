@@ -23,6 +23,7 @@ from torch.cuda import amp
 from torch.nn.parallel import DistributedDataParallel as DDP
 
 from ultralytics.cfg import get_cfg, get_save_dir
+from ultralytics.data.build import DevicePrefetcher
 from ultralytics.data.utils import check_cls_dataset, check_det_dataset
 from ultralytics.nn.tasks import attempt_load_one_weight, attempt_load_weights
 from ultralytics.utils import (DEFAULT_CFG, LOGGER, RANK, TQDM, __version__, callbacks, clean_url, colorstr, emojis,
@@ -68,6 +69,7 @@ class BaseTrainer:
         fitness (float): Current fitness value.
         loss (float): Current loss value.
         tloss (float): Total loss value.
+        data_wait (float): Seconds the last epoch waited for preprocessed batches if `prefetch`, see DevicePrefetcher.
         loss_names (list): List of loss names.
         csv (Path): Path to results CSV file.
     """
@@ -293,6 +295,7 @@ class BaseTrainer:
         self._setup_train(world_size)
 
         self.epoch_time = None
+        self.data_wait = None
         self.epoch_time_start = time.time()
         self.train_time_start = time.time()
         nb = len(self.train_loader)  # number of batches
@@ -313,7 +316,6 @@ class BaseTrainer:
             self.model.train()
             if RANK != -1:
                 self.train_loader.sampler.set_epoch(epoch)
-            pbar = enumerate(self.train_loader)
             # Update dataloader attributes (optional)
             if epoch == (self.epochs - self.args.close_mosaic):
                 LOGGER.info('Closing dataloader mosaic')
@@ -323,9 +325,12 @@ class BaseTrainer:
                     self.train_loader.dataset.close_mosaic(hyp=self.args)
                 self.train_loader.reset()
 
+            loader = DevicePrefetcher(self.train_loader, self.preprocess_batch, self.device, amp=self.amp) \
+                if self.args.prefetch else self.train_loader  # next batch on device
+            pbar = enumerate(loader)
             if RANK in (-1, 0):
                 LOGGER.info(self.progress_string())
-                pbar = TQDM(enumerate(self.train_loader), total=nb)
+                pbar = TQDM(enumerate(loader), total=nb)
             self.tloss = None
             self.optimizer.zero_grad()
             for i, batch in pbar:
@@ -344,7 +349,8 @@ class BaseTrainer:
 
                 # Forward
                 with torch.cuda.amp.autocast(self.amp):
-                    batch = self.preprocess_batch(batch)
+                    if not self.args.prefetch:  # else already preprocessed by DevicePrefetcher
+                        batch = self.preprocess_batch(batch)
                     self.loss, self.loss_items = self.model(batch)
                     if RANK != -1:
                         self.loss *= world_size
@@ -374,6 +380,10 @@ class BaseTrainer:
                 self.run_callbacks('on_train_batch_end')
 
             self.lr = {f'lr/pg{ir}': x['lr'] for ir, x in enumerate(self.optimizer.param_groups)}  # for loggers
+            if self.args.prefetch:
+                self.data_wait = loader.wait  # seconds the epoch waited for data
+                LOGGER.debug(f'Waited {self.data_wait:.1f}s for data '
+                             f'({self.data_wait / max(time.time() - self.epoch_time_start, 1e-9):.0%} of epoch)')
 
             with warnings.catch_warnings():
                 warnings.simplefilter('ignore')  # suppress 'Detected lr_scheduler.step() before optimizer.step()'
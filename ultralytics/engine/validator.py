@@ -26,6 +26,7 @@ import numpy as np
 import torch
 
 from ultralytics.cfg import get_cfg, get_save_dir
+from ultralytics.data.build import DevicePrefetcher
 from ultralytics.data.utils import check_cls_dataset, check_det_dataset
 from ultralytics.nn.autobackend import AutoBackend
 from ultralytics.utils import LOGGER, TQDM, callbacks, colorstr, emojis
@@ -150,18 +151,21 @@ class BaseValidator:
             self.dataloader = self.dataloader or self.get_dataloader(self.data.get(self.args.split), self.args.batch)
 
             model.eval()
-            model.warmup(imgsz=(1 if pt else self.args.batch, 2, imgsz, imgsz))  # warmup
+            model.warmup(imgsz=(1 if pt else self.args.batch, model.ch, imgsz, imgsz))  # warmup
 
         dt = Profile(), Profile(), Profile(), Profile()
-        bar = TQDM(self.dataloader, desc=self.get_desc(), total=len(self.dataloader))
+        loader = DevicePrefetcher(self.dataloader, self.preprocess, self.device) if self.args.prefetch \
+            else self.dataloader  # preprocess the next batch ahead
+        bar = TQDM(loader, desc=self.get_desc(), total=len(self.dataloader))
         self.init_metrics(de_parallel(model))
         self.jdict = []  # empty before each val
         for batch_i, batch in enumerate(bar):
             self.run_callbacks('on_val_batch_start')
             self.batch_i = batch_i
             # Preprocess
-            with dt[0]:
-                batch = self.preprocess(batch)
+            if not self.args.prefetch:  # else already preprocessed by DevicePrefetcher
+                with dt[0]:
+                    batch = self.preprocess(batch)
 
             # Inference
             with dt[1]:
@@ -182,6 +186,8 @@ class BaseValidator:
                 self.plot_predictions(batch, preds, batch_i)
 
             self.run_callbacks('on_val_batch_end')
+        if self.args.prefetch:
+            dt[0].t = loader.t  # preprocess time, spent in the background thread
         stats = self.get_stats()
         self.check_stats(stats)
         self.speed = dict(zip(self.speed.keys(), (x.t / len(self.dataloader.dataset) * 1E3 for x in dt)))
@@ -39,7 +39,8 @@ class RTDETRDataset(YOLODataset):
                    return_keypoint=self.use_keypoints,
                    batch_idx=True,
                    mask_ratio=hyp.mask_ratio,
-                   mask_overlap=hyp.overlap_mask))
+                   mask_overlap=hyp.overlap_mask,
+                   packbits=self.events['packbits']))
         return transforms
 
 
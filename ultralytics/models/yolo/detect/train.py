@@ -5,10 +5,12 @@ from copy import copy
 import numpy as np
 
 from ultralytics.data import build_dataloader, build_yolo_dataset
+from ultralytics.data.augment import BatchRandomPerspective
+from ultralytics.data.utils import check_events_dataset
 from ultralytics.engine.trainer import BaseTrainer
 from ultralytics.models import yolo
-from ultralytics.nn.tasks import DetectionModel
-from ultralytics.utils import LOGGER, RANK
+from ultralytics.nn.tasks import DetectionModel, yaml_model_load
+from ultralytics.utils import LOGGER, RANK, ops
 from ultralytics.utils.plotting import plot_images, plot_labels, plot_results
 from ultralytics.utils.torch_utils import de_parallel, torch_distributed_zero_first
 
@@ -49,11 +51,27 @@ class DetectionTrainer(BaseTrainer):
             LOGGER.warning("WARNING ⚠️ 'rect=True' is incompatible with DataLoader shuffle, setting shuffle=False")
             shuffle = False
         workers = self.args.workers if mode == 'train' else self.args.workers * 2
+        if mode == 'train' and self.args.batch_augment and self.args.task == 'detect':  # see v8_transforms()
+            self.batch_transforms = BatchRandomPerspective(degrees=self.args.degrees,
+                                                           translate=self.args.translate,
+                                                           scale=self.args.scale,
+                                                           shear=self.args.shear,
+                                                           perspective=self.args.perspective,
+                                                           flipud=self.args.flipud,
+                                                           fliplr=self.args.fliplr,
+                                                           border_value=0)  # empty histograms, as the mosaic
         return build_dataloader(dataset, batch_size, workers, shuffle, rank)  # return dataloader
 
     def preprocess_batch(self, batch):
         """Preprocesses a batch of images by scaling and converting to float."""
-        batch['img'] = batch['img'].to(self.device, non_blocking=True).float() / 255
+        if self.data.get('packbits'):  # bit-packed binarized histograms
+            batch['img'] = ops.unpackbits(batch['img'].to(self.device, non_blocking=True))
+        else:
+            batch['img'] = batch['img'].to(self.device, non_blocking=True).float() / 255
+        if getattr(self, 'batch_transforms', None):  # batch_augment=True, geometric augmentation on the device
+            for k in 'bboxes', 'cls', 'batch_idx':
+                batch[k] = batch[k].to(self.device, non_blocking=True)
+            batch = self.batch_transforms(batch)
         return batch
 
     def set_model_attributes(self):
@@ -66,9 +84,20 @@ class DetectionTrainer(BaseTrainer):
         self.model.args = self.args  # attach hyperparameters to model
         # TODO: self.model.class_weights = labels_to_class_weights(dataset.labels, nc).to(device) * nc
 
+    def get_model_cfg(self, cfg):
+        """Return model `cfg` with input channels `ch` derived from the dataset, 2 polarities per stacked histogram."""
+        if cfg is None:
+            return cfg
+        cfg = dict(cfg if isinstance(cfg, dict) else yaml_model_load(cfg))  # copy, the YAML of a loaded model is kept
+        ch = 2 * check_events_dataset(self.data)['temporal_stack']
+        if cfg.get('ch') != ch:
+            LOGGER.info(f"Overriding model.yaml ch={cfg.get('ch')} with ch={ch}")
+            cfg['ch'] = ch
+        return cfg
+
     def get_model(self, cfg=None, weights=None, verbose=True):
         """Return a YOLO detection model."""
-        model = DetectionModel(cfg, nc=self.data['nc'], verbose=verbose and RANK == -1)
+        model = DetectionModel(self.get_model_cfg(cfg), nc=self.data['nc'], verbose=verbose and RANK == -1)
         if weights:
             model.load(weights)
         return model
@@ -44,7 +44,10 @@ class DetectionValidator(BaseValidator):
     def preprocess(self, batch):
         """Preprocesses batch of images for YOLO training."""
         batch['img'] = batch['img'].to(self.device, non_blocking=True)
-        batch['img'] = (batch['img'].half() if self.args.half else batch['img'].float()) / 255
+        if self.data.get('packbits'):  # bit-packed binarized histograms
+            batch['img'] = ops.unpackbits(batch['img'], dtype=torch.half if self.args.half else torch.float)
+        else:
+            batch['img'] = (batch['img'].half() if self.args.half else batch['img'].float()) / 255
         for k in ['batch_idx', 'cls', 'bboxes']:
             batch[k] = batch[k].to(self.device)
 
@@ -84,6 +84,7 @@ class AutoBackend(nn.Module):
         fp16 &= pt or jit or onnx or xml or engine or nn_module or triton  # FP16
         nhwc = coreml or saved_model or pb or tflite or edgetpu  # BHWC formats (vs torch BCWH)
         stride = 32  # default stride
+        ch = 2  # default input channels, (positive, negative) event histograms
         model, metadata = None, None
 
         # Set device
@@ -103,6 +104,7 @@ class AutoBackend(nn.Module):
             if hasattr(model, 'kpt_shape'):
                 kpt_shape = model.kpt_shape  # pose-only
             stride = max(int(model.stride.max()), 32)  # model stride
+            ch = getattr(model, 'yaml', {}).get('ch', ch)  # input channels
             names = model.module.names if hasattr(model, 'module') else model.names  # get class names
             model.half() if fp16 else model.float()
             self.model = model  # explicitly assign for to(), cpu(), cuda(), half()
@@ -116,6 +118,7 @@ class AutoBackend(nn.Module):
             if hasattr(model, 'kpt_shape'):
                 kpt_shape = model.kpt_shape  # pose-only
             stride = max(int(model.stride.max()), 32)  # model stride
+            ch = getattr(model, 'yaml', {}).get('ch', ch)  # input channels
             names = model.module.names if hasattr(model, 'module') else model.names  # get class names
             model.half() if fp16 else model.float()
             self.model = model  # explicitly assign for to(), cpu(), cuda(), half()
@@ -291,7 +294,7 @@ class AutoBackend(nn.Module):
             metadata = yaml_load(metadata)
         if metadata:
             for k, v in metadata.items():
-                if k in ('stride', 'batch'):
+                if k in ('stride', 'batch', 'ch'):
                     metadata[k] = int(v)
                 elif k in ('imgsz', 'names', 'kpt_shape') and isinstance(v, str):
                     metadata[k] = eval(v)
@@ -301,6 +304,7 @@ class AutoBackend(nn.Module):
             imgsz = metadata['imgsz']
             names = metadata['names']
             kpt_shape = metadata.get('kpt_shape')
+            ch = metadata.get('ch', ch)
         elif not (pt or triton or nn_module):
             LOGGER.warning(f"WARNING ⚠️ Metadata not found for 'model={weights}'")
 
@@ -31,21 +31,31 @@ def on_predict_start(predictor, persist=False):
     assert cfg.tracker_type in ['bytetrack', 'botsort'], \
         f"Only support 'bytetrack' and 'botsort' for now, but got '{cfg.tracker_type}'"
     trackers = []
-    for _ in range(predictor.dataset.bs):
+    for _ in range(1 if predictor.dataset.mode == 'events' else predictor.dataset.bs):
         tracker = TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=30)
         trackers.append(tracker)
     predictor.trackers = trackers
+    predictor.tracked_file = None  # recording followed by the tracker of an events source
 
 
 def on_predict_postprocess_end(predictor):
-    """Postprocess detected boxes and update with object tracking."""
-    bs = predictor.dataset.bs
-    im0s = predictor.batch[1]
-    for i in range(bs):
+    """
+    Postprocess detected boxes and update with object tracking.
+
+    Batches of an events source are consecutive frames of one recording, they update a single tracker in order, on
+    frames without detections too, and the tracker is reset when the next recording starts.
+    """
+    paths, im0s = predictor.batch[:2]
+    events = predictor.dataset.mode == 'events'
+    if events and paths[0] != predictor.tracked_file:
+        tracker = predictor.trackers[0]
+        predictor.trackers[0] = type(tracker)(args=tracker.args, frame_rate=30)
+        predictor.tracked_file = paths[0]
+    for i in range(len(predictor.results)):
         det = predictor.results[i].boxes.cpu().numpy()
-        if len(det) == 0:
+        if len(det) == 0 and not events:
             continue
-        tracks = predictor.trackers[i].update(det, im0s[i])
+        tracks = predictor.trackers[0 if events else i].update(det, im0s[i])
         if len(tracks) == 0:
             continue
         idx = tracks[:, -1].astype(int)
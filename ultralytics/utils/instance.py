@@ -78,6 +78,11 @@ class Bboxes:
     #     self.bboxes[:, 1::2] /= h
     #     self.normalized = True
 
+    def writeable(self):
+        """Copy boxes shared read-only with dataset labels before the first in-place change, copy-on-write."""
+        if not self.bboxes.flags.writeable:
+            self.bboxes = self.bboxes.copy()
+
     def mul(self, scale):
         """
         Args:
@@ -87,6 +92,7 @@ class Bboxes:
             scale = to_4tuple(scale)
         assert isinstance(scale, (tuple, list))
         assert len(scale) == 4
+        self.writeable()
         self.bboxes[:, 0] *= scale[0]
         self.bboxes[:, 1] *= scale[1]
         self.bboxes[:, 2] *= scale[2]
@@ -101,6 +107,7 @@ class Bboxes:
             offset = to_4tuple(offset)
         assert isinstance(offset, (tuple, list))
         assert len(offset) == 4
+        self.writeable()
         self.bboxes[:, 0] += offset[0]
         self.bboxes[:, 1] += offset[1]
         self.bboxes[:, 2] += offset[2]
@@ -168,11 +175,13 @@ class Instances:
             bboxes (ndarray): bboxes with shape [N, 4].
             segments (list | ndarray): segments.
             keypoints (ndarray): keypoints(x, y, visible) with shape [N, 17, 3].
+
+        Read-only bboxes shared with dataset labels are copied on their first in-place change, keypoints on creation.
         """
         if segments is None:
             segments = []
         self._bboxes = Bboxes(bboxes=bboxes, format=bbox_format)
-        self.keypoints = keypoints
+        self.keypoints = keypoints if keypoints is None or keypoints.flags.writeable else keypoints.copy()
         self.normalized = normalized
 
         if len(segments) > 0:
@@ -268,6 +277,7 @@ class Instances:
 
     def flipud(self, h):
         """Flips the coordinates of bounding boxes, segments, and keypoints vertically."""
+        self._bboxes.writeable()
         if self._bboxes.format == 'xyxy':
             y1 = self.bboxes[:, 1].copy()
             y2 = self.bboxes[:, 3].copy()
@@ -281,6 +291,7 @@ class Instances:
 
     def fliplr(self, w):
         """Reverses the order of the bounding boxes and segments horizontally."""
+        self._bboxes.writeable()
         if self._bboxes.format == 'xyxy':
             x1 = self.bboxes[:, 0].copy()
             x2 = self.bboxes[:, 2].copy()
@@ -296,6 +307,7 @@ class Instances:
         """Clips bounding boxes, segments, and keypoints values to stay within image boundaries."""
         ori_format = self._bboxes.format
         self.convert_bbox(format='xyxy')
+        self._bboxes.writeable()
         self.bboxes[:, [0, 2]] = self.bboxes[:, [0, 2]].clip(0, w)
         self.bboxes[:, [1, 3]] = self.bboxes[:, [1, 3]].clip(0, h)
         if ori_format != 'xyxy':
@@ -1,6 +1,7 @@
 # Ultralytics YOLO 🚀, AGPL-3.0 license
 
 import contextlib
+import functools
 import math
 import re
 import time
@@ -59,6 +60,29 @@ class Profile(contextlib.ContextDecorator):
         return time.time()
 
 
+def unpackbits(x, dtype=torch.float32, scale=1 / 255):
+    """
+    Unpack and normalize an uint8 tensor bit-packed along its last dim by `np.packbits`, in one gather on its device.
+
+    Args:
+        x (torch.Tensor): (..., W / 8) uint8 tensor, most significant bit first.
+        dtype (torch.dtype): Output dtype. Defaults to torch.float32.
+        scale (float): Value of a set bit, 1 / 255 matches the normalization of 0/1 uint8 images. Defaults to 1 / 255.
+
+    Returns:
+        (torch.Tensor): (..., W) tensor of 0 and `scale` values.
+    """
+    lut = _unpackbits_lut(x.device, dtype, scale)  # (256, 8)
+    return lut[x.int()].flatten(-2)
+
+
+@functools.lru_cache(maxsize=8)
+def _unpackbits_lut(device, dtype, scale):
+    """Return the (256, 8) bits of every byte value times `scale` on `device`."""
+    bits = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1)
+    return (torch.from_numpy(bits).to(dtype) * scale).to(device)
+
+
 def segment2box(segment, width=640, height=640):
     """
     Convert 1 segment label to 1 box label, applying inside-image constraint, i.e. (xy1, xy2, ...) to (xyxy).
@@ -370,15 +370,15 @@ def viz_histo_binarized(im):
     Visualize binarized histogram of events
 
     Args:
-        im (np.ndarray): Array of shape (2,H,W)
+        im (np.ndarray): Array of shape (2,H,W), or (2*T,H,W) stacked histograms of which the newest is shown
 
     Returns:
         output_array (np.ndarray): Array of shape (H,W,3)
     """
     img = np.full(im.shape[-2:] + (3,), BG_COLOR, dtype=np.uint8)
-    y, x = np.where(im[0] > 0)
+    y, x = np.where(im[-2] > 0)
     img[y, x, :] = POS_COLOR
-    y, x = np.where(im[1] > 0)
+    y, x = np.where(im[-1] > 0)
     img[y, x, :] = NEG_COLOR
     return img
 